@@ -1,46 +1,321 @@
 # File: apps/pkm-indexer/organize.py
 import os
+import io
+import codecs
+import errno
 import shutil
 import time
+import datetime
 import frontmatter
 import openai
 import re
 import json
+import hashlib
+import uuid
+import functools
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import threading
+import queue
+import collections
+import itertools
+import mmap
+import asyncio
+import tenacity
 from pathlib import Path
 import pdfplumber
 import pytesseract
 from PIL import Image
 import requests
+import requests.adapters
 from bs4 import BeautifulSoup
 import logging # Add logging import if not already there
 
+try:
+    import orjson
+    _json_loads = orjson.loads  # orjson.JSONDecodeError subclasses json.JSONDecodeError
+except ImportError:
+    _json_loads = json.loads
+try:
+    from json_repair import repair_json
+except ImportError:
+    repair_json = None
+try:
+    import xxhash
+    _content_hasher = xxhash.xxh3_64
+except ImportError:
+    _content_hasher = functools.partial(hashlib.blake2b, digest_size=16)
+
 openai.api_key = os.getenv("OPENAI_API_KEY")
 logger = logging.getLogger(__name__) # Or use your existing logger
 
+# File extension -> file type used to route extraction and output folders
+_EXT_MAP = {
+    ".md": "text", ".txt": "text",
+    ".pdf": "pdf",
+    ".png": "image", ".jpg": "image", ".jpeg": "image", ".gif": "image", ".bmp": "image",
+    ".mp3": "audio", ".wav": "audio", ".m4a": "audio",
+    ".doc": "document", ".docx": "document",
+    ".ppt": "presentation", ".pptx": "presentation",
+    ".xls": "spreadsheet", ".xlsx": "spreadsheet",
+    ".rtf": "rtf",
+}
+
+# Every folder organize_files can file into: one per type, "sources" for
+# unrecognised types, and "errors" for failures
+OUTPUT_SUBFOLDERS = tuple(sorted(set(_EXT_MAP.values()) | {"sources", "errors"}))
+
+# Pre-compiled patterns used on every ingested file
+_URL_RE = re.compile(r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+(?:/[-\w%!.~\'()*+,;=:@/&?=]*)?')
+_MD_LINK_RE = re.compile(r'\[([^\]]+)\]\(([^)]+)\)')
+_TITLE_RE = re.compile(r'(?:^|\n)(?:\d+\)|\-)\s*([^""\n]+?)(?= by | \()')
+_RTF_CTRL_RE = re.compile(r'\\[a-z]+(-?\d+)?[ ]?')
+_RTF_BRACES_RE = re.compile(r'\{|\}|\\|\|')
+# Metadata fields organize_files writes; other fields are serialized by the frontmatter library
+_FRONTMATTER_FIELDS = frozenset({
+    "title", "author", "date", "category", "tags", "extract_title", "extract_content",
+    "parse_status", "extraction_method", "file_type", "source", "reviewed",
+    "reprocess_status", "reprocess_rounds", "source_url", "content_hash",
+})
+# Characters YAML rejects or folds as line breaks when unescaped (json.dumps already escapes C0 controls)
+_YAML_UNPRINTABLE_RE = re.compile('[\x7f-\x9f\u2028\u2029\ufffe\uffff]')
+# Lone surrogates can't be written as valid YAML or UTF-8; those posts go through the library
+_SURROGATE_RE = re.compile('[\ud800-\udfff]')
+# Characters not allowed in metadata file names
+_SAFE_NAME_RE = re.compile(r'[^\w\-_. ]')
+# Text that appears to be a clickable reference (common in PDFs with links that don't have explicit URLs),
+# fused into one alternation so the text is scanned once
+_REFERENCE_RE = re.compile(
+    r'(?P<title>[A-Z][a-z]+(?:\s[A-Z][a-z]+)*\s(?:AI|ML|for\sEveryone|Intelligence|Awareness|Machine|clone))'  # AI-related titles
+    r'|(?P<ref>my book|my AI clone|Appendix [A-Z]|Foundry from HBS)'  # References to books, appendices, etc.
+    r'|(?<=see\s)(?P<see>[^\.,:;\n]+)'  # Things after "see" are often references
+)
+
+# Common words that aren't likely to be meaningful link titles
+_LINK_STOPWORDS = frozenset({'and', 'the', 'this', 'that', 'with', 'from', 'after', 'before'})
+
+# Shared HTTP session so URL enrichment reuses keep-alive connections
+URL_FETCH_WORKERS = 16
+URL_PREVIEW_BYTES = 32768
+_SESSION = requests.Session()
+_SESSION.headers.update({
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+})
+_http_adapter = requests.adapters.HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=2)
+_SESSION.mount("http://", _http_adapter)
+_SESSION.mount("https://", _http_adapter)
+
+try:
+    import lxml  # noqa: F401
+    _HTML_PARSER = "lxml"
+except ImportError:
+    _HTML_PARSER = "html.parser"
+
+# Default location for cached GPT extracts, keyed by content hash
+# Lives beside main.py's metadata folder (pkm/Processed/Metadata) unless overridden
+EXTRACT_CACHE_DIR = os.getenv("PKM_EXTRACT_CACHE_DIR", os.path.join("pkm", "Processed", "Metadata", ".extract_cache"))
+# In-process LRU of recent cache hits and stores; the server is long-lived, so it's bounded
+EXTRACT_MEMO_SIZE = 1024
+_extract_memo = collections.OrderedDict()
+_extract_memo_lock = threading.Lock()
+
+# Transient OpenAI failures worth retrying with backoff
+OPENAI_MAX_ATTEMPTS = 5
+_RETRYABLE_OPENAI_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.APIError,
+    openai.error.Timeout,
+    openai.error.ServiceUnavailableError,
+    openai.error.APIConnectionError,
+    TimeoutError,
+)
+
+# Maximum OpenAI metadata requests in flight during organize_files
+LLM_CONCURRENCY = 20
+
+# Longest text get_extract works on (~3K tokens); longer documents keep their head and tail
+MAX_LLM_CHARS = 12000
+
+# Content-hash index of already organized files, kept in metadata_folder
+CONTENT_CACHE_NAME = ".cache.json"
+HASH_CHUNK_BYTES = 1 << 20
+
+# Threads that write metadata and move files into the output folder during organize_files
+MOVE_WORKERS = 4
+
+# Guards output-name selection across organize_files worker threads
+_output_paths_lock = threading.Lock()
+
+# LinkedIn exports are recognised from markers near the start of the text
+LINKEDIN_SCAN_CHARS = 16384
+_LINKEDIN_PATTERNS = (r"linkedin\.com", r"Profile viewers")
+_LINKEDIN_RE = re.compile("|".join(_LINKEDIN_PATTERNS), re.IGNORECASE)
+try:
+    # Hyperscan matches all markers in one pass over the raw bytes when it's installed
+    import hyperscan
+    _LINKEDIN_HS_DB = hyperscan.Database()
+    _LINKEDIN_HS_DB.compile(
+        expressions=[p.encode() for p in _LINKEDIN_PATTERNS],
+        ids=list(range(len(_LINKEDIN_PATTERNS))),
+        flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH] * len(_LINKEDIN_PATTERNS),
+    )
+except Exception:  # not installed, or no usable CPU support
+    _LINKEDIN_HS_DB = None
+_hs_local = threading.local()  # Hyperscan scratch space can't be shared between threads
+
+# Markers for the start of the comments section in LinkedIn PDFs
+_LI_COMMENT_INDICATORS = (
+    "Reactions",
+    "Like · Reply",
+    "comments · ",
+    "reposts",
+    "Most relevant",
+)
+_LI_COMMENT_RE = re.compile('|'.join(map(re.escape, _LI_COMMENT_INDICATORS)))
+
+# 256-entry threshold lookup tables for OCR preprocessing
+_LUT_120 = bytes(0 if x < 120 else 255 for x in range(256))
+_LUT_150 = bytes(0 if x < 150 else 255 for x in range(256))
+_LUT_180 = bytes(0 if x < 180 else 255 for x in range(256))
+
+# True inside organize_files' extraction pool, where the pool already uses every
+# core; per-file fan-out (PDF page pools, parallel OCR passes) is skipped there
+_IN_WORKER = False
+
+# PDFs with at least this many pages are extracted across worker processes
+PDF_PARALLEL_MIN_PAGES = 4
+# Fast-path (pypdf) text shorter than this falls back to pdfplumber
+PDF_FAST_PATH_MIN_CHARS = 1000
+
+# Types whose extraction is a cheap read; these run on the worker thread instead of
+# paying a round trip to the process pool
+INLINE_EXTRACT_TYPES = frozenset({"text", "audio", "other"})
+# Heaviest workloads are dispatched first, one type at a time, so each library stays warm
+# in the pool processes and the long OCR/PDF jobs aren't left for the end of the run
+EXTRACT_DISPATCH_ORDER = ("image", "pdf", "presentation", "document", "spreadsheet", "rtf")
+# Inbox paths are grouped for dispatch this many at a time; a new group waits until at most
+# this many are still in flight, so neither the walk nor its futures are held in memory
+INBOX_BATCH_SIZE = 256
+
+# Files of unknown type are probed from this many leading bytes; ones that aren't
+# UTF-8 text (usually binaries) keep only that much, marked as truncated
+FALLBACK_READ_BYTES = 65536
+FALLBACK_TRUNCATED_MARKER = "\n…[truncated: binary or non-UTF-8 file]…"
+
+@functools.lru_cache(maxsize=256)
+def _ext_to_type(ext):
+    """Map a raw file suffix to its type folder; memoized since few distinct suffixes occur."""
+    return _EXT_MAP.get(ext.lower().strip(), "other") # Added .strip()
+
 def infer_file_type(filename):
-    ext = Path(filename).suffix.lower().strip() # Added .strip()
-    if ext in [".md", ".txt"]: return "text"
-    if ext in [".pdf"]: return "pdf"
-    if ext in [".png", ".jpg", ".jpeg", ".gif", ".bmp"]: return "image"
-    if ext in [".mp3", ".wav", ".m4a"]: return "audio"
-    if ext in [".doc", ".docx"]: return "document"
-    if ext in [".ppt", ".pptx"]: return "presentation"
-    if ext in [".xls", ".xlsx"]: return "spreadsheet"
-    if ext in [".rtf"]: return "rtf"
-    return "other"
+    return _ext_to_type(os.path.splitext(filename)[1])
 
-def extract_text_from_pdf(path):
+def _pool_context():
+    """
+    Start method for organize_files' extraction pool and the PDF page pool.
+    
+    Pool processes start lazily from worker threads while the OpenAI loop and
+    the move threads are running, and forking a multithreaded process can
+    deadlock on locks held by those threads. forkserver (or spawn) starts them clean.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+class ExtractionFailure(str):
+    """
+    Placeholder text returned by an extractor that couldn't read the file.
+    
+    It's still a str for callers that just want text, but organize_files
+    checks for it so a failed read isn't summarized and cached as if it
+    were the document.
+    """
+
+def _mark_pool_worker():
+    """ProcessPoolExecutor initializer for organize_files' extraction pool."""
+    global _IN_WORKER
+    _IN_WORKER = True
+
+def _extract_one_page(path, page_no):
+    """Extract text from a single PDF page. Runs in a worker process."""
+    with pdfplumber.open(path) as pdf:
+        return pdf.pages[page_no].extract_text() or ""
+
+def _extract_pdf_text_pypdf(path):
+    """Fast plain-text extraction for born-digital PDFs. Returns None if pypdf is unavailable or fails."""
     try:
-        with pdfplumber.open(path) as pdf:
-            text = "\n".join(page.extract_text() or "" for page in pdf.pages)
-            
-            # Check if this looks like a LinkedIn post
-            if "Profile viewers" in text[:500] or "Post impressions" in text[:500] or "linkedin.com" in text.lower():
-                return process_linkedin_pdf(text, path)
-            
-            return text
+        from pypdf import PdfReader
+        reader = PdfReader(path)
+        return "\n".join(page.extract_text() or "" for page in reader.pages)
     except Exception as e:
-        return f"[PDF extraction failed: {e}]"
+        logger.info(f"pypdf extraction unavailable for {path}: {e}")
+        return None
+
+def _is_usable_pdf_text(text):
+    """Heuristic for whether fast-path text is good enough to skip layout analysis."""
+    if not text or len(text) < PDF_FAST_PATH_MIN_CHARS:
+        return False
+    return sum(c.isalpha() for c in text) / len(text) >= 0.3
+
+def _extract_pdf_text_pdfplumber(path):
+    """Layout-aware extraction with pdfplumber, split across processes for longer PDFs."""
+    with pdfplumber.open(path) as pdf:
+        n_pages = len(pdf.pages)
+        if n_pages < PDF_PARALLEL_MIN_PAGES or _IN_WORKER:
+            # Not worth the pool startup cost for short PDFs, and already parallel across files in a worker
+            parts = []
+            for page in pdf.pages:
+                parts.append(page.extract_text() or "")
+                page.flush_cache()  # Release the page's cached chars/lines before the next one
+            return "\n".join(parts)
+    
+    # Layout analysis is CPU-bound Python, so split pages across processes; started
+    # clean like the extraction pool, since the caller may be running other threads
+    max_workers = min(os.cpu_count() or 1, n_pages)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=_pool_context()) as ex:
+        texts = list(ex.map(functools.partial(_extract_one_page, path), range(n_pages), chunksize=4))
+    return "\n".join(texts)
+
+def _looks_like_linkedin(text):
+    """Check the head of extracted text for LinkedIn export markers."""
+    # Only scan the head of the text rather than lowercasing the whole document
+    head = text[:LINKEDIN_SCAN_CHARS]
+    if _LINKEDIN_HS_DB is None:
+        return bool(_LINKEDIN_RE.search(head))
+    scratch = getattr(_hs_local, "scratch", None)
+    if scratch is None:
+        scratch = _hs_local.scratch = hyperscan.Scratch(_LINKEDIN_HS_DB)
+    matched = []
+    def on_match(*_):
+        matched.append(True)
+        return True  # stop at the first marker
+    try:
+        _LINKEDIN_HS_DB.scan(head.encode("utf-8", "ignore"), match_event_handler=on_match, scratch=scratch)
+    except hyperscan.ScanTerminated:
+        pass
+    return bool(matched)
+
+def _extract_pdf(path):
+    """Extract text from a PDF. Returns (text, extraction_method) naming the backend that produced it."""
+    method = "pypdf"
+    try:
+        # Born-digital PDFs extract fine without layout analysis; only fall back
+        # to pdfplumber when the fast path yields little or garbled text
+        text = _extract_pdf_text_pypdf(path)
+        if not _is_usable_pdf_text(text):
+            method = "pdfplumber"
+            text = _extract_pdf_text_pdfplumber(path)
+        
+        # Check if this looks like a LinkedIn post
+        if "Post impressions" in text[:500] or _looks_like_linkedin(text):
+            return process_linkedin_pdf(text, path), method
+        
+        return text, method
+    except Exception as e:
+        return ExtractionFailure(f"[PDF extraction failed: {e}]"), method
+
+def extract_text_from_pdf(path):
+    return _extract_pdf(path)[0]
     
 def extract_text_from_docx(path):
     """Extract text content from a .docx file."""
@@ -63,7 +338,7 @@ def extract_text_from_docx(path):
         
         return "\n\n".join(full_text)
     except Exception as e:
-        return f"[Word document extraction failed: {e}]"
+        return ExtractionFailure(f"[Word document extraction failed: {e}]")
 
 def extract_text_from_pptx(path):
     """Extract text content from a .pptx file."""
@@ -83,81 +358,111 @@ def extract_text_from_pptx(path):
         
         return "\n\n".join(full_text)
     except Exception as e:
-        return f"[PowerPoint extraction failed: {e}]"
+        return ExtractionFailure(f"[PowerPoint extraction failed: {e}]")
+
+def _cell_text(cell):
+    """Render a spreadsheet cell the way openpyxl's values print."""
+    if cell is None:
+        return ""
+    # calamine returns every number as a float and date-only cells as dates;
+    # openpyxl gives ints and datetimes, so IDs and years don't turn into "2024.0"
+    # (only below 2**53, where every integer is exact; openpyxl prints larger ones as floats)
+    if type(cell) is float and cell.is_integer() and abs(cell) < 2**53:
+        return str(int(cell))
+    if type(cell) is datetime.date:
+        return str(datetime.datetime.combine(cell, datetime.time()))
+    return str(cell)
+
+def _sheet_rows_text(rows):
+    """Yield the non-empty rows of a sheet as ' | '-joined text."""
+    for row in rows:
+        row_text = " | ".join(map(_cell_text, row))
+        if row_text.strip():
+            yield row_text
 
 def extract_text_from_xlsx(path):
     """Extract text content from an .xlsx file."""
     try:
-        import openpyxl
-        wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
-        full_text = []
+        workbook = None
+        try:
+            # calamine parses the workbook natively and is much faster than openpyxl
+            from python_calamine import CalamineWorkbook
+            calamine_wb = CalamineWorkbook.from_path(path)
+            sheets = ((name, calamine_wb.get_sheet_by_name(name).to_python(skip_empty_area=False)) for name in calamine_wb.sheet_names)
+        except ImportError:
+            import openpyxl
+            workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+            sheets = ((name, workbook[name].values) for name in workbook.sheetnames)
         
-        for sheet_name in wb.sheetnames:
-            sheet = wb[sheet_name]
-            sheet_text = [f"--- Sheet: {sheet_name} ---"]
-            
-            for row in sheet.iter_rows(values_only=True):
-                row_text = " | ".join([str(cell) if cell is not None else "" for cell in row])
-                if row_text.strip():
-                    sheet_text.append(row_text)
-            
-            if len(sheet_text) > 1:  # Only add sheets with actual content
-                full_text.append("\n\n".join(sheet_text))
+        full_text = io.StringIO()
+        try:
+            for sheet_name, rows in sheets:
+                sheet_text = "\n\n".join(_sheet_rows_text(rows))
+                if sheet_text:  # Only add sheets with actual content
+                    if full_text.tell():
+                        full_text.write("\n\n")
+                    full_text.write(f"--- Sheet: {sheet_name} ---\n\n")
+                    full_text.write(sheet_text)
+        finally:
+            if workbook is not None:
+                workbook.close()
         
-        return "\n\n".join(full_text)
+        return full_text.getvalue()
     except Exception as e:
-        return f"[Excel extraction failed: {e}]"
+        return ExtractionFailure(f"[Excel extraction failed: {e}]")
+
+def _read_text_mmap(path, errors='strict'):
+    """Read a UTF-8 text file through a read-only memory map and decode it once, with universal newlines."""
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return ""  # mmap cannot map empty files
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            text = mm[:].decode('utf-8', errors=errors)
+    # Match text-mode open(): Windows-authored files shouldn't leave stray CRs in metadata and the index
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
 
 def extract_text_from_markdown(path):
     """Extract text content from .md files, preserving the original markdown."""
     try:
-        with open(path, 'r', encoding='utf-8') as file:
-            content = file.read()
+        content = _read_text_mmap(path)
         # Just return the raw markdown - it's already text
         return content
     except Exception as e:
-        return f"[Markdown extraction failed: {e}]"
+        return ExtractionFailure(f"[Markdown extraction failed: {e}]")
 
 def extract_text_from_rtf(path):
     """Extract text content from .rtf files."""
+    # Read once; both the regex scrub and the striprtf fallback work on these bytes
+    try:
+        content = _read_text_mmap(path, errors='ignore')
+    except Exception as e:
+        return ExtractionFailure(f"[RTF extraction failed: {e}]")
+    
     try:
-        with open(path, 'r', encoding='utf-8', errors='ignore') as file:
-            content = file.read()
-            
         # Basic RTF parsing to remove control codes
         # For better parsing, we'd use the python-rtf library
         # This is a simple fallback in case the library fails
-        text = re.sub(r'\\[a-z]+(-?\d+)?[ ]?', ' ', content)
-        text = re.sub(r'\{|\}|\\|\|', '', text)
+        text = _RTF_CTRL_RE.sub(' ', content)
+        text = _RTF_BRACES_RE.sub('', text)
         
         return text
     except Exception as e:
         try:
             # If basic parsing fails, try using the python-rtf library
-            import striprtf
-            with open(path, 'r', encoding='utf-8', errors='ignore') as file:
-                content = file.read()
-            return striprtf.rtf_to_text(content)
+            from striprtf.striprtf import rtf_to_text
+            return rtf_to_text(content)
         except Exception as rtf_error:
-            return f"[RTF extraction failed: {e}, {rtf_error}]"
+            return ExtractionFailure(f"[RTF extraction failed: {e}, {rtf_error}]")
 
 def process_linkedin_pdf(text, path):
     """Process LinkedIn PDF content to extract the main post and ignore comments."""
     try:
-        # Pattern to detect the start of comments section
-        comment_indicators = [
-            "Reactions", 
-            "Like · Reply",
-            "comments · ",
-            "reposts",
-            "Most relevant"
-        ]
-        
-        # Pattern to detect URLs in the text
-        url_pattern = r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+(?:/[-\w%!.~\'()*+,;=:@/&?=]*)?'
-        
         # Find all URLs in the original content
-        main_urls = re.findall(url_pattern, text)
+        main_urls = _URL_RE.findall(text)
         important_urls = []
         
         # Split content by lines to process
@@ -180,7 +485,7 @@ def process_linkedin_pdf(text, path):
         # Process the content line by line
         for i, line in enumerate(lines):
             # Check if we've hit the comments section
-            if any(indicator in line for indicator in comment_indicators) and i > 10:
+            if i > 10 and _LI_COMMENT_RE.search(line):
                 in_comments = True
                 continue
                 
@@ -197,7 +502,7 @@ def process_linkedin_pdf(text, path):
             # Process author comment content
             if author_comment_section:
                 # Look for URLs or other important info in first author comment
-                urls_in_comment = re.findall(url_pattern, line)
+                urls_in_comment = _URL_RE.findall(line)
                 if urls_in_comment:
                     important_urls.extend(urls_in_comment)
                     
@@ -205,13 +510,14 @@ def process_linkedin_pdf(text, path):
                 if "Like · Reply" in line or "Like · " in line:
                     author_comment_section = False
         
-        # Combine the main content
-        main_content = '\n'.join(main_content_lines)
-        
         # Add any important URLs from author comments if they weren't in the main content
+        main_urls_set = set(main_urls)
         for url in important_urls:
-            if url not in main_urls and ("lnkd.in" in url or ".com" in url):  # LinkedIn short URLs are often important
-                main_content += f"\n\nAdditional URL from author comment: {url}"
+            if url not in main_urls_set and ("lnkd.in" in url or ".com" in url):  # LinkedIn short URLs are often important
+                main_content_lines.append(f"\nAdditional URL from author comment: {url}")
+        
+        # Combine the main content
+        main_content = '\n'.join(main_content_lines)
                 
         print("📱 Detected LinkedIn post, removed comments section")
         return main_content
@@ -219,42 +525,81 @@ def process_linkedin_pdf(text, path):
         print(f"Error processing LinkedIn content: {e}")
         return text  # Return original if processing fails
 
+@functools.lru_cache(maxsize=1)
+def _tesseract_languages():
+    """Installed tesseract languages, probed once per process. None if the probe fails."""
+    try:
+        return frozenset(pytesseract.get_languages(config=""))
+    except Exception as e:
+        logger.warning(f"Could not list tesseract languages: {e}")
+        return None
+
+def _ocr(image, lang, fallback_lang=None):
+    """Run tesseract on a preprocessed image, retrying with fallback_lang if given."""
+    try:
+        return pytesseract.image_to_string(image, lang=lang)
+    except Exception:
+        if fallback_lang:
+            return pytesseract.image_to_string(image, lang=fallback_lang)
+        raise
+
 def extract_text_from_image(path):
     try:
         # Open and process image
         image = Image.open(path)
         
         # Try multiple preprocessing approaches
-        texts = []
+        variants = []
+        
+        # Convert to grayscale once and share it across the approaches. Thresholds
+        # use the prebuilt lookup tables so PIL applies them in C, not per pixel in Python
+        gray = image.convert("L")
         
         # Approach 1: Original with adjusted threshold
-        img1 = image.convert("L")
-        img1 = img1.point(lambda x: 0 if x < 120 else 255)  # Lowered threshold
-        texts.append(pytesseract.image_to_string(img1, lang="eng"))
+        img1 = gray.point(_LUT_120)  # Lowered threshold
+        variants.append((img1, "eng", None))
         
-        # Approach 2: Try Danish language if available
-        try:
-            texts.append(pytesseract.image_to_string(img1, lang="dan"))
-        except:
-            # If Danish not installed, try with English
-            pass
+        # Approach 2: Try Danish language if available. If the language probe
+        # failed, try anyway and let the pass fail as before
+        languages = _tesseract_languages()
+        has_danish = languages is None or "dan" in languages
+        if has_danish:
+            variants.append((img1, "dan", None))
         
         # Approach 3: Try with different preprocessing
-        img3 = image.convert("L")
-        img3 = img3.resize((int(img3.width * 1.5), int(img3.height * 1.5)), Image.LANCZOS)  # Upsample
-        img3 = img3.point(lambda x: 0 if x < 150 else 255)  # Different threshold
+        img3 = gray.resize((int(gray.width * 1.5), int(gray.height * 1.5)), Image.LANCZOS)  # Upsample
+        img3 = img3.point(_LUT_150)  # Different threshold
         
         # Try multilingual if available
-        try:
-            texts.append(pytesseract.image_to_string(img3, lang="dan+eng"))
-        except:
-            texts.append(pytesseract.image_to_string(img3, lang="eng"))
+        if has_danish:
+            variants.append((img3, "dan+eng", "eng" if languages is None else None))
+        else:
+            variants.append((img3, "eng", None))
         
         # Approach 4: Higher contrast for slide presentations
-        img4 = image.convert("L")
         # Apply more aggressive contrast for presentation slides
-        img4 = img4.point(lambda x: 0 if x < 180 else 255)
-        texts.append(pytesseract.image_to_string(img4, lang="eng"))
+        img4 = gray.point(_LUT_180)
+        variants.append((img4, "eng", None))
+        
+        # Each pass runs in its own tesseract subprocess, so threads are enough to
+        # run them concurrently (the GIL is released while waiting on the process)
+        # (in an extraction-pool worker other images already occupy the cores, so run them in turn)
+        def run_pass(variant):
+            try:
+                return _ocr(*variant)
+            except Exception:
+                # Language not installed or tesseract failure - skip this pass
+                return None
+        if _IN_WORKER:
+            results = [run_pass(variant) for variant in variants]
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(variants)) as ex:
+                results = list(ex.map(run_pass, variants))
+        
+        # Keep the original pass order so ties resolve the same way
+        texts = [t for t in results if t is not None]
+        if not texts:
+            return ExtractionFailure("[OCR failed: no OCR pass succeeded]")
         
         # Use the longest text result that isn't just garbage
         valid_texts = [t for t in texts if len(t.strip()) > 20]
@@ -265,12 +610,12 @@ def extract_text_from_image(path):
         
         # If we got nothing meaningful, report failure
         if len(text.strip()) < 20:
-            return "[OCR produced insufficient text. Manual processing recommended.]"
+            return ExtractionFailure("[OCR produced insufficient text. Manual processing recommended.]")
             
         print("🖼️ OCR output:", repr(text[:500]))
         return text
     except Exception as e:
-        return f"[OCR failed: {e}]"
+        return ExtractionFailure(f"[OCR failed: {e}]")
 
 def extract_urls(text):
     """
@@ -278,47 +623,97 @@ def extract_urls(text):
     title-based references that might be links.
     """
     # Standard URL pattern
-    url_pattern = r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+(?:/[-\w%!.~\'()*+,;=:@/&?=]*)?'
-    urls = re.findall(url_pattern, text)
+    urls = _URL_RE.findall(text)
     
     # Also look for linked text with URLs like [text](url)
-    markdown_links = re.findall(r'\[([^\]]+)\]\(([^)]+)\)', text)
+    markdown_links = _MD_LINK_RE.findall(text)
     markdown_urls = [link[1] for link in markdown_links if link[1].startswith('http')]
     
-    # Look for potential title links in specific formats
-    potential_links = []
+    # Look for potential title links in specific formats (a set, so duplicates drop as we go)
+    potential_links = set()
     
     # Look for titles that might be links (for PDF resources lists)
     # Pattern: title followed by "by Author" - common in resource lists
-    title_pattern = r'(?:^|\n)(?:\d+\)|\-)\s*([^""\n]+?)(?= by | \()'
-    potential_titles = re.findall(title_pattern, text)
+    potential_titles = _TITLE_RE.findall(text)
     
     # Also look for text that appears to be a clickable reference
-    # Common in PDFs with links that don't have explicit URLs
-    reference_patterns = [
-        r'([A-Z][a-z]+(?:\s[A-Z][a-z]+)*\s(?:AI|ML|for\sEveryone|Intelligence|Awareness|Machine|clone))',  # AI-related titles
-        r'(my book|my AI clone|Appendix [A-Z]|Foundry from HBS)',  # References to books, appendices, etc.
-        r'(?<=see\s)([^\.,:;\n]+)'  # Things after "see" are often references
-    ]
-    
-    for pattern in reference_patterns:
-        found = re.findall(pattern, text)
-        potential_links.extend([link.strip() for link in found if len(link.strip()) > 5])
+    for match in _REFERENCE_RE.finditer(text):
+        link = match.group(match.lastgroup).strip()
+        if len(link) > 5:
+            potential_links.add(link)
     
     # Add potential titles that look like resources
-    potential_links.extend([title.strip() for title in potential_titles if len(title.strip()) > 5])
+    potential_links.update(title for title in (t.strip() for t in potential_titles) if len(title) > 5)
     
-    # Remove duplicates and very common words that aren't likely to be meaningful links
-    potential_links = list(set(potential_links))
-    filtered_links = [link for link in potential_links if link.lower() not in 
-                     ['and', 'the', 'this', 'that', 'with', 'from', 'after', 'before']]
+    # Remove very common words that aren't likely to be meaningful links
+    filtered_links = [link for link in potential_links if link.lower() not in _LINK_STOPWORDS]
     
-    all_urls = list(set(urls + markdown_urls))  # Remove duplicates
+    all_urls = list({*urls, *markdown_urls})  # Remove duplicates
     print("🔗 URLs detected:", all_urls)
     print("🔍 Potential link titles:", filtered_links[:15])
     
     return all_urls, filtered_links
 
+def _enrich_url(url, title_map):
+    """Fetch the head of a page and build its (markdown entry, metadata) pair."""
+    try:
+        # Stream and only read the head of the page - enough for <title> and <meta description>.
+        # iter_content can yield short pieces (e.g. one HTTP chunk each), so collect up to the limit
+        head = bytearray()
+        with _SESSION.get(url, stream=True, timeout=10) as r:
+            for chunk in r.iter_content(URL_PREVIEW_BYTES):
+                head += chunk
+                if len(head) >= URL_PREVIEW_BYTES:
+                    break
+        soup = BeautifulSoup(bytes(head[:URL_PREVIEW_BYTES]), _HTML_PARSER)
+        
+        # Try to get title
+        title = "(No title)"
+        if soup.title and soup.title.string:
+            title = soup.title.string.strip()
+        
+        # Try to get description
+        description = ""
+        meta_desc = soup.find('meta', attrs={'name': 'description'}) or soup.find('meta', attrs={'property': 'og:description'})
+        if meta_desc and 'content' in meta_desc.attrs:
+            description = meta_desc['content'].strip()
+            if len(description) > 150:
+                description = description[:150] + "..."
+        
+        # Check if this URL might match a potential title we found
+        url_lower = url.lower()
+        matching_title = None
+        for potential_title_lower, original_title in title_map.items():
+            # See if any words from the potential title appear in the URL
+            words = potential_title_lower.split()
+            if any(word in url_lower for word in words if len(word) > 3):
+                matching_title = original_title
+                break
+        
+        # Use matching title if found
+        if matching_title and len(matching_title) > 5:
+            display_title = matching_title
+        else:
+            display_title = title
+            
+        enriched_entry = f"- [{display_title}]({url})"
+        if description:
+            enriched_entry += f"\n  *{description}*"
+        
+        # Store metadata for later use
+        return enriched_entry, {
+            "title": display_title,
+            "description": description[:150] if description else "",
+            "url": url
+        }
+        
+    except Exception as e:
+        return f"- {url} (unreachable: {str(e)[:50]})", {
+            "title": url,
+            "description": f"Error: {str(e)[:50]}",
+            "url": url
+        }
+
 def enrich_urls(urls, potential_titles=None):
     enriched = []
     metadata = {}
@@ -330,306 +725,1101 @@ def enrich_urls(urls, potential_titles=None):
             # Store lowercase version for case-insensitive matching
             title_map[title.lower()] = title
     
-    for url in urls:
-        try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            r = requests.get(url, timeout=10, headers=headers)
-            soup = BeautifulSoup(r.text, "html.parser")
-            
-            # Try to get title
-            title = "(No title)"
-            if soup.title and soup.title.string:
-                title = soup.title.string.strip()
-            
-            # Try to get description
-            description = ""
-            meta_desc = soup.find('meta', attrs={'name': 'description'}) or soup.find('meta', attrs={'property': 'og:description'})
-            if meta_desc and 'content' in meta_desc.attrs:
-                description = meta_desc['content'].strip()
-                if len(description) > 150:
-                    description = description[:150] + "..."
-            
-            # Check if this URL might match a potential title we found
-            url_lower = url.lower()
-            matching_title = None
-            for potential_title_lower, original_title in title_map.items():
-                # See if any words from the potential title appear in the URL
-                words = potential_title_lower.split()
-                if any(word in url_lower for word in words if len(word) > 3):
-                    matching_title = original_title
-                    break
-            
-            # Use matching title if found
-            if matching_title and len(matching_title) > 5:
-                display_title = matching_title
-            else:
-                display_title = title
-                
-            enriched_entry = f"- [{display_title}]({url})"
-            if description:
-                enriched_entry += f"\n  *{description}*"
-                
-            enriched.append(enriched_entry)
-            
-            # Store metadata for later use
-            metadata[url] = {
-                "title": display_title,
-                "description": description[:150] if description else "",
-                "url": url
-            }
-            
-        except Exception as e:
-            enriched.append(f"- {url} (unreachable: {str(e)[:50]})")
-            metadata[url] = {
-                "title": url,
-                "description": f"Error: {str(e)[:50]}",
-                "url": url
-            }
+    # Fetching is pure network I/O, so overlap the requests on threads
+    urls = list(urls)
+    if urls:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(URL_FETCH_WORKERS, len(urls))) as ex:
+            for url, (entry, url_metadata) in zip(urls, ex.map(lambda u: _enrich_url(u, title_map), urls)):
+                enriched.append(entry)
+                metadata[url] = url_metadata
     
     print("🔍 Enriched URLs block:\n", "\n".join(enriched))
     return "\n".join(enriched), metadata
 
-def get_extract(content, file_type=None, urls_metadata=None, log_f=None, is_linkedin=False):
+def _extract_cache_key(model, prompt, content):
+    """Fingerprint an extract request by model, prompt variant and full content."""
+    return hashlib.sha256(f"{model}|{prompt}|{content}".encode("utf-8", errors="ignore")).hexdigest()
+
+def _remember_extract(key, result):
+    """Add a result to the in-process LRU, evicting the oldest entries past EXTRACT_MEMO_SIZE."""
+    with _extract_memo_lock:
+        _extract_memo[key] = result
+        _extract_memo.move_to_end(key)
+        while len(_extract_memo) > EXTRACT_MEMO_SIZE:
+            _extract_memo.popitem(last=False)
+
+def _load_cached_extract(cache_dir, key):
+    """Return a cached (title, extract, tags) tuple, or None on a miss."""
+    with _extract_memo_lock:
+        if key in _extract_memo:
+            _extract_memo.move_to_end(key)
+            return _extract_memo[key]
     try:
-        # Check if OpenAI API key is configured
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key or not api_key.strip():
-            error_msg = "OpenAI API key not configured. Please set OPENAI_API_KEY environment variable."
-            print(f"🚫 Error: {error_msg}")
-            logger.error(f"OpenAI API key is missing or invalid: '{api_key}'")
+        with open(os.path.join(cache_dir, f"{key}.json"), "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        result = (cached["title"], cached["extract"], cached["tags"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    _remember_extract(key, result)
+    return result
+
+def _store_cached_extract(cache_dir, key, result):
+    """Persist a successful extract so unchanged content skips the OpenAI call next run."""
+    _remember_extract(key, result)
+    title, extract, tags = result
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(os.path.join(cache_dir, f"{key}.json"), "w", encoding="utf-8") as f:
+            json.dump({"title": title, "extract": extract, "tags": tags}, f)
+    except OSError as e:
+        logger.warning(f"Could not write extract cache entry {key}: {e}")
+
+def _loads_model_json(raw):
+    """Parse model JSON, repairing slightly malformed output before giving up."""
+    try:
+        return _json_loads(raw)
+    except json.JSONDecodeError:
+        if repair_json is None:
+            raise
+        return _json_loads(repair_json(raw))
+
+def _parse_extract_response(raw, content, file_type=None, log_f=None):
+    """
+    Turn a raw GPT extract response into a (title, extract, tags) tuple.
+    
+    Returns:
+        Tuple of (result, complete). complete is False when the reply wasn't a JSON
+        object with the expected fields and the result was salvaged from raw text;
+        those results aren't cached, so the next call asks the model again.
+    """
+    content_length = len(content)
+    
+    # Try to parse as JSON
+    try:
+        parsed = _loads_model_json(raw)
+        
+        # Validate the expected fields
+        if not isinstance(parsed, dict) or "extract_title" not in parsed or "extract_content" not in parsed:
             if log_f:
-                log_f.write(f"OpenAI ERROR: {error_msg}\n")
-            return "Missing API Key", "Extract failed: OpenAI API key not configured. Please add OPENAI_API_KEY to environment variables.", ["extraction_failed"]
+                got = list(parsed.keys()) if isinstance(parsed, dict) else type(parsed).__name__
+                log_f.write(f"JSON parsing successful but missing required fields. Got: {got}\n")
+            # Use whatever fields did parse and fall back to the raw text
+            if not isinstance(parsed, dict):
+                parsed = {}
+            title = parsed.get("extract_title") or "Extracted Title"
+            extract = parsed.get("extract_content") or raw
+            tags = parsed.get("tags")
+            if isinstance(tags, str):
+                tags = [tag.strip() for tag in tags.split(',')]
+            if not tags:
+                tags = ["extracted"]
+                
+            return (title, extract, tags), False
         
-        # Make sure the API key is set in openai module
-        openai.api_key = api_key
+        # Get the extracted information
+        title = parsed.get("extract_title", "Untitled")
+        extract = parsed.get("extract_content", "No summary generated.")
+        tags = parsed.get("tags", ["untagged"])
         
-        print("🧠 Content sent to GPT (preview):\n", content[:500])
+        # Basic validation
+        if not title or title == "Untitled":
+            # Try to generate a title from the first line of content
+            first_line = content.split('\n')[0].strip()
+            if len(first_line) > 5 and len(first_line) < 100:
+                title = first_line
         
-        # Determine appropriate extract length based on content
-        content_length = len(content)
-        if content_length < 1000:
-            # For very short content, keep extract concise
-            extract_length = 200
-            model = "gpt-4"
-        elif content_length < 5000:
-            # For medium content, medium extract
-            extract_length = 500
-            model = "gpt-4"
-        else:
-            # For longer, complex content, allow longer extracts
-            extract_length = 2000  # Up to ~400 words for complex content
-            model = "gpt-4"  # Better for complex content
-        
-        # Check if this appears to be a resource list/links-heavy doc
-        has_resource_patterns = (
-            "resources" in content.lower() and 
-            (content.count("\n1)") > 1 or content.count("\n2)") > 1)
+        # Make sure extract isn't empty
+        if not extract or extract == "No summary." or extract == "No summary generated.":
+            if content_length < 1000:
+                # For short content, just use the original
+                extract = content
+            else:
+                # For longer content, use the first 500 chars
+                extract = content[:500] + "... (Extract generation failed, showing original content preview)"
+        
+        # Make sure we have some tags
+        if not tags or tags == ["untagged"]:
+            # Generate some basic tags from content
+            if "AI" in content:
+                tags.append("AI")
+            if "book" in content.lower() or "publication" in content.lower():
+                tags.append("Reading")
+            if "research" in content.lower():
+                tags.append("Research")
+            if file_type:
+                tags.append(file_type.capitalize())
+        
+        return (title, extract, tags), True
+        
+    except json.JSONDecodeError as json_err:
+        if log_f:
+            log_f.write(f"JSON parsing error: {str(json_err)}\nRaw text: {raw[:500]}...\n")
+        
+        # Attempt to extract meaningful content from non-JSON response
+        lines = raw.split('\n')
+        title = "Untitled"
+        for line in lines:
+            if "title" in line.lower() and ":" in line:
+                title = line.split(":", 1)[1].strip().strip('"\'')
+                break
+        
+        # Just use the raw output as the extract
+        extract = raw
+        
+        # Generate basic tags
+        tags = []
+        for line in lines:
+            if "tags" in line.lower() and ":" in line:
+                tags_part = line.split(":", 1)[1].strip()
+                tags = [t.strip().strip('",[]') for t in tags_part.split(",")]
+                break
+        
+        if not tags:
+            tags = ["extracted"]
+            if file_type:
+                tags.append(file_type.capitalize())
+        
+        return (title, extract, tags), False
+
+def _truncate_for_llm(text, limit=MAX_LLM_CHARS):
+    """Cap text at limit characters, keeping the start and end of long documents."""
+    if len(text) <= limit:
+        return text
+    half = limit // 2
+    return text[:half] + "\n…[truncated]…\n" + text[-half:]
+
+def _ensure_api_key(log_f=None):
+    """Set the OpenAI key from the environment, or return the failure tuple if it's missing."""
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key or not api_key.strip():
+        error_msg = "OpenAI API key not configured. Please set OPENAI_API_KEY environment variable."
+        print(f"🚫 Error: {error_msg}")
+        logger.error(f"OpenAI API key is missing or invalid: '{api_key}'")
+        if log_f:
+            log_f.write(f"OpenAI ERROR: {error_msg}\n")
+        return "Missing API Key", "Extract failed: OpenAI API key not configured. Please add OPENAI_API_KEY to environment variables.", ["extraction_failed"]
+    
+    # Make sure the API key is set in openai module
+    openai.api_key = api_key
+    return None
+
+def _build_extract_prompt(content, file_type=None, urls_metadata=None, is_linkedin=False):
+    """Pick the model, token budget and prompt variant for a get_extract request."""
+    # Determine appropriate extract length based on content
+    content_length = len(content)
+    if content_length < 1000:
+        # For very short content, keep extract concise
+        extract_length = 200
+        model = "gpt-4"
+    elif content_length < 5000:
+        # For medium content, medium extract
+        extract_length = 500
+        model = "gpt-4"
+    else:
+        # For longer, complex content, allow longer extracts
+        extract_length = 2000  # Up to ~400 words for complex content
+        model = "gpt-4"  # Better for complex content
+    
+    # Check if this appears to be a resource list/links-heavy doc
+    has_resource_patterns = (
+        "resources" in content.lower() and 
+        (content.count("\n1)") > 1 or content.count("\n2)") > 1)
+    )
+    
+    # Different prompt based on content type
+    if has_resource_patterns:
+        # For resource-list style documents
+        prompt = (
+            "You are analyzing a document that appears to be a resource list with references, links, and learning materials.\n\n"
+            "Create a detailed summary that specifically includes ALL referenced resources, people, and links. "
+            "Also provide relevant tags that capture the subject matter and type of resources.\n\n"
+            "In your extract, make sure to preserve:\n"
+            "1. All resource names and titles\n"
+            "2. All author names and affiliations\n"
+            "3. All categories of resources\n"
+            "4. Any referenced websites, tools, or platforms\n\n"
+            "Respond in this JSON format:\n"
+            "{\n  \"extract_title\": \"...\",\n  \"extract_content\": \"...\",\n  \"tags\": [\"tag1\", \"tag2\"]\n}\n\n"
+            f"Content:\n{content[:5000]}"
         )
+    elif is_linkedin:
+        prompt = (
+            "You are analyzing a LinkedIn post. Create a clear title and detailed summary that captures "
+            "the key points, insights, and any URLs/resources mentioned in the post. Ignore promotional content.\n\n"
+            "Focus on what makes this post valuable for knowledge management purposes.\n\n"
+            "Respond in this JSON format:\n"
+            "{\n  \"extract_title\": \"...\",\n  \"extract_content\": \"...\",\n  \"tags\": [\"tag1\", \"tag2\"]\n}\n\n"
+            f"LinkedIn Post Content:\n{content[:5000]}"
+        )
+    elif file_type == "image":
+        prompt = (
+            "You are analyzing text extracted from an image via OCR. The text may have errors or be incomplete.\n\n"
+            "Create a meaningful title and summary of what this image contains, plus relevant tags.\n\n"
+            "For complex content, provide a detailed summary that captures the key information.\n\n"
+            "Respond in this JSON format:\n"
+            "{\n  \"extract_title\": \"...\",\n  \"extract_content\": \"...\",\n  \"tags\": [\"tag1\", \"tag2\"]\n}\n\n"
+            f"OCR Text:\n{content[:5000]}"
+        )
+    elif urls_metadata and len(urls_metadata) > 0:
+        # Create a summary of URLs for the prompt
+        url_summary = "\n".join([f"- {data['title']}: {data['url']}" for url, data in urls_metadata.items()])
         
-        # Different prompt based on content type
-        if has_resource_patterns:
-            # For resource-list style documents
-            prompt = (
-                "You are analyzing a document that appears to be a resource list with references, links, and learning materials.\n\n"
-                "Create a detailed summary that specifically includes ALL referenced resources, people, and links. "
-                "Also provide relevant tags that capture the subject matter and type of resources.\n\n"
-                "In your extract, make sure to preserve:\n"
-                "1. All resource names and titles\n"
-                "2. All author names and affiliations\n"
-                "3. All categories of resources\n"
-                "4. Any referenced websites, tools, or platforms\n\n"
-                "Respond in this JSON format:\n"
-                "{\n  \"extract_title\": \"...\",\n  \"extract_content\": \"...\",\n  \"tags\": [\"tag1\", \"tag2\"]\n}\n\n"
-                f"Content:\n{content[:5000]}"
-            )
-        elif is_linkedin:
-            prompt = (
-                "You are analyzing a LinkedIn post. Create a clear title and detailed summary that captures "
-                "the key points, insights, and any URLs/resources mentioned in the post. Ignore promotional content.\n\n"
-                "Focus on what makes this post valuable for knowledge management purposes.\n\n"
-                "Respond in this JSON format:\n"
-                "{\n  \"extract_title\": \"...\",\n  \"extract_content\": \"...\",\n  \"tags\": [\"tag1\", \"tag2\"]\n}\n\n"
-                f"LinkedIn Post Content:\n{content[:5000]}"
-            )
-        elif file_type == "image":
-            prompt = (
-                "You are analyzing text extracted from an image via OCR. The text may have errors or be incomplete.\n\n"
-                "Create a meaningful title and summary of what this image contains, plus relevant tags.\n\n"
-                "For complex content, provide a detailed summary that captures the key information.\n\n"
-                "Respond in this JSON format:\n"
-                "{\n  \"extract_title\": \"...\",\n  \"extract_content\": \"...\",\n  \"tags\": [\"tag1\", \"tag2\"]\n}\n\n"
-                f"OCR Text:\n{content[:5000]}"
-            )
-        elif urls_metadata and len(urls_metadata) > 0:
-            # Create a summary of URLs for the prompt
-            url_summary = "\n".join([f"- {data['title']}: {data['url']}" for url, data in urls_metadata.items()])
+        prompt = (
+            "You are summarizing content that contains valuable URLs and references.\n\n"
+            "Create a title and detailed summary preserving key information, plus relevant tags.\n"
+            "For rich content with many references, provide a comprehensive summary.\n\n"
+            "Pay special attention to these detected URLs and resources:\n\n"
+            f"{url_summary}\n\n"
+            "Respond in this JSON format:\n"
+            "{\n  \"extract_title\": \"...\",\n  \"extract_content\": \"...\",\n  \"tags\": [\"tag1\", \"tag2\"]\n}\n\n"
+            f"Content:\n{content[:5000]}"
+        )
+    else:
+        prompt = (
+            "You are a semantic summarizer. Return a short title and a deeper thematic summary, plus relevant tags.\n\n"
+            "For complex or information-rich content, provide a detailed summary that captures the key points.\n\n"
+            "Respond in this JSON format:\n"
+            "{\n  \"extract_title\": \"...\",\n  \"extract_content\": \"...\",\n  \"tags\": [\"tag1\", \"tag2\"]\n}\n\n"
+            f"Content:\n{content[:5000]}"
+        )
+    
+    return model, extract_length, prompt
+
+def _extract_failure(e, content, file_type=None, log_f=None):
+    """Build the (title, extract, tags) tuple reported when extraction errors out."""
+    if log_f:
+        log_f.write(f"OpenAI ERROR: {e}\n")
+    print(f"🚫 Error in get_extract: {e}")
+    
+    # Provide a more meaningful extract with the error
+    error_title = "Extraction Failed"
+    error_extract = f"The AI extraction process encountered an error: {str(e)}\n\nContent preview:\n{content[:300]}..."
+    
+    # Generate tags based on available information
+    fallback_tags = ["extraction_failed"]
+    if file_type:
+        fallback_tags.append(file_type.capitalize())
+    
+    return error_title, error_extract, fallback_tags
+
+class RateBudget:
+    """
+    Sliding one-minute window of OpenAI requests and tokens, shared by every caller.
+    
+    Callers reserve capacity before each request and wait until the window has
+    room, so bursts queue up locally instead of tripping 429s.
+    """
+    
+    def __init__(self, rpm=60, tpm=150_000):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._events = collections.deque()  # (timestamp, tokens)
+        self._tokens = 0
+        self._lock = threading.Lock()  # Shared across threads and event loops
+    
+    def _reserve(self, tokens):
+        """Record a request if it fits in the window, otherwise return seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            while self._events and now - self._events[0][0] >= 60:
+                _, old_tokens = self._events.popleft()
+                self._tokens -= old_tokens
             
-            prompt = (
-                "You are summarizing content that contains valuable URLs and references.\n\n"
-                "Create a title and detailed summary preserving key information, plus relevant tags.\n"
-                "For rich content with many references, provide a comprehensive summary.\n\n"
-                "Pay special attention to these detected URLs and resources:\n\n"
-                f"{url_summary}\n\n"
-                "Respond in this JSON format:\n"
-                "{\n  \"extract_title\": \"...\",\n  \"extract_content\": \"...\",\n  \"tags\": [\"tag1\", \"tag2\"]\n}\n\n"
-                f"Content:\n{content[:5000]}"
-            )
-        else:
-            prompt = (
-                "You are a semantic summarizer. Return a short title and a deeper thematic summary, plus relevant tags.\n\n"
-                "For complex or information-rich content, provide a detailed summary that captures the key points.\n\n"
-                "Respond in this JSON format:\n"
-                "{\n  \"extract_title\": \"...\",\n  \"extract_content\": \"...\",\n  \"tags\": [\"tag1\", \"tag2\"]\n}\n\n"
-                f"Content:\n{content[:5000]}"
-            )
+            tokens = min(tokens, self.tpm)  # An oversized request still gets to run alone
+            if len(self._events) < self.rpm and self._tokens + tokens <= self.tpm:
+                self._events.append((now, tokens))
+                self._tokens += tokens
+                return 0
+            return max(60 - (now - self._events[0][0]), 0.05)
+    
+    async def acquire(self, tokens=0):
+        while True:
+            wait = self._reserve(tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+    
+    def acquire_blocking(self, tokens=0):
+        while True:
+            wait = self._reserve(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
+
+_RATE_BUDGET = RateBudget(
+    rpm=int(os.getenv("OPENAI_RPM", "60")),
+    tpm=int(os.getenv("OPENAI_TPM", "150000")),
+)
+
+def _estimate_tokens(kwargs):
+    """Rough token cost of a ChatCompletion request: ~4 chars per prompt token plus the completion budget."""
+    prompt_chars = sum(len(m.get("content") or "") for m in kwargs.get("messages", []))
+    return prompt_chars // 4 + kwargs.get("max_tokens", 0)
+
+def _log_openai_retry(retry_state):
+    print(f"🔄 OpenAI API error, retrying ({retry_state.attempt_number}/{OPENAI_MAX_ATTEMPTS}): {retry_state.outcome.exception()}")
+
+# Retry only errors that a later attempt can fix; anything else fails straight away
+_openai_retry = tenacity.retry(
+    retry=tenacity.retry_if_exception_type(_RETRYABLE_OPENAI_ERRORS),
+    wait=tenacity.wait_random_exponential(min=1, max=60),
+    stop=tenacity.stop_after_attempt(OPENAI_MAX_ATTEMPTS),
+    before_sleep=_log_openai_retry,
+    reraise=True,
+)
+
+@_openai_retry
+def _create_chat_completion(**kwargs):
+    """ChatCompletion call gated by the shared rate budget, with backoff retries."""
+    _RATE_BUDGET.acquire_blocking(_estimate_tokens(kwargs))
+    return openai.ChatCompletion.create(**kwargs)
+
+@_openai_retry
+async def _acreate_chat_completion(**kwargs):
+    """Async ChatCompletion call gated by the shared rate budget, with backoff retries."""
+    await _RATE_BUDGET.acquire(_estimate_tokens(kwargs))
+    return await openai.ChatCompletion.acreate(**kwargs)
+
+def get_extract(content, file_type=None, urls_metadata=None, log_f=None, is_linkedin=False, cache_dir=None):
+    if cache_dir is None:
+        cache_dir = EXTRACT_CACHE_DIR
+    try:
+        # Check if OpenAI API key is configured
+        missing_key = _ensure_api_key(log_f)
+        if missing_key:
+            return missing_key
+        
+        # Everything below (prompt choice, cache key, parsing) only needs a bounded slice
+        content = _truncate_for_llm(content)
+        
+        print("🧠 Content sent to GPT (preview):\n", content[:500])
+        
+        model, extract_length, prompt = _build_extract_prompt(content, file_type, urls_metadata, is_linkedin)
+        
+        # Reuse the previous extract if this exact content was already summarized
+        cache_key = _extract_cache_key(model, prompt, content)
+        cached = _load_cached_extract(cache_dir, cache_key)
+        if cached:
+            print("♻️ Using cached extract")
+            if log_f:
+                log_f.write(f"Using cached extract {cache_key}\n")
+            return cached
         
         # Log the prompt for debugging
         if log_f:
             log_f.write(f"OpenAI Prompt: {prompt[:500]}...\n")
         
-        # Add retries for API call reliability
-        max_retries = 3
-        retry_delay = 2  # seconds
+        # Retries with backoff on rate limits and transient errors happen inside the call
+        response = _create_chat_completion(
+            model=model,
+            messages=[
+                {"role": "system", "content": "You analyze content and extract semantic meaning."},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=extract_length,  # Dynamic based on content
+            temperature=0.7  # Balanced between creativity and accuracy
+        )
         
-        for attempt in range(max_retries):
-            try:
-                response = openai.ChatCompletion.create(
-                    model=model,
-                    messages=[
-                        {"role": "system", "content": "You analyze content and extract semantic meaning."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=extract_length,  # Dynamic based on content
-                    temperature=0.7  # Balanced between creativity and accuracy
-                )
-                
-                # Process the raw response
-                raw = response["choices"][0]["message"]["content"]
-                
-                # Log the raw response for debugging
-                if log_f:
-                    log_f.write(f"OpenAI Raw Response: {raw[:500]}...\n")
-                
-                # Try to parse as JSON
-                try:
-                    parsed = json.loads(raw)
-                    
-                    # Validate the expected fields
-                    if "extract_title" not in parsed or "extract_content" not in parsed:
-                        if log_f:
-                            log_f.write(f"JSON parsing successful but missing required fields. Got: {list(parsed.keys())}\n")
-                        # Try a fallback approach - extract from raw text if possible
-                        title_match = re.search(r'"extract_title":\s*"([^"]+)"', raw)
-                        content_match = re.search(r'"extract_content":\s*"([^"]+)"', raw)
-                        tags_match = re.search(r'"tags":\s*\[(.*?)\]', raw)
-                        
-                        title = title_match.group(1) if title_match else "Extracted Title"
-                        extract = content_match.group(1) if content_match else raw
-                        
-                        if tags_match:
-                            tags_str = tags_match.group(1)
-                            tags = [tag.strip('"\'') for tag in tags_str.split(',')]
-                        else:
-                            tags = ["extracted"]
-                            
-                        return title, extract, tags
-                    
-                    # Get the extracted information
-                    title = parsed.get("extract_title", "Untitled")
-                    extract = parsed.get("extract_content", "No summary generated.")
-                    tags = parsed.get("tags", ["untagged"])
-                    
-                    # Basic validation
-                    if not title or title == "Untitled":
-                        # Try to generate a title from the first line of content
-                        first_line = content.split('\n')[0].strip()
-                        if len(first_line) > 5 and len(first_line) < 100:
-                            title = first_line
-                    
-                    # Make sure extract isn't empty
-                    if not extract or extract == "No summary." or extract == "No summary generated.":
-                        if content_length < 1000:
-                            # For short content, just use the original
-                            extract = content
-                        else:
-                            # For longer content, use the first 500 chars
-                            extract = content[:500] + "... (Extract generation failed, showing original content preview)"
-                    
-                    # Make sure we have some tags
-                    if not tags or tags == ["untagged"]:
-                        # Generate some basic tags from content
-                        if "AI" in content:
-                            tags.append("AI")
-                        if "book" in content.lower() or "publication" in content.lower():
-                            tags.append("Reading")
-                        if "research" in content.lower():
-                            tags.append("Research")
-                        if file_type:
-                            tags.append(file_type.capitalize())
-                    
-                    return title, extract, tags
-                    
-                except json.JSONDecodeError as json_err:
-                    if log_f:
-                        log_f.write(f"JSON parsing error: {str(json_err)}\nRaw text: {raw[:500]}...\n")
-                    
-                    # Attempt to extract meaningful content from non-JSON response
-                    lines = raw.split('\n')
-                    title = "Untitled"
-                    for line in lines:
-                        if "title" in line.lower() and ":" in line:
-                            title = line.split(":", 1)[1].strip().strip('"\'')
-                            break
-                    
-                    # Just use the raw output as the extract
-                    extract = raw
-                    
-                    # Generate basic tags
-                    tags = []
-                    for line in lines:
-                        if "tags" in line.lower() and ":" in line:
-                            tags_part = line.split(":", 1)[1].strip()
-                            tags = [t.strip().strip('",[]') for t in tags_part.split(",")]
-                            break
-                    
-                    if not tags:
-                        tags = ["extracted"]
-                        if file_type:
-                            tags.append(file_type.capitalize())
-                    
-                    return title, extract, tags
-                
-            except Exception as api_error:
-                if attempt < max_retries - 1:
-                    print(f"🔄 OpenAI API error, retrying ({attempt+1}/{max_retries}): {str(api_error)}")
-                    if log_f:
-                        log_f.write(f"OpenAI API error, retrying: {str(api_error)}\n")
-                    time.sleep(retry_delay * (2 ** attempt))  # Exponential backoff
-                else:
-                    # Last attempt failed, raise the error to be caught by outer try-except
-                    raise api_error
+        # Process the raw response
+        raw = response["choices"][0]["message"]["content"]
+        
+        # Log the raw response for debugging
+        if log_f:
+            log_f.write(f"OpenAI Raw Response: {raw[:500]}...\n")
         
-        # If we got here, all retries failed
-        raise Exception("All OpenAI API retries failed")
+        result, complete = _parse_extract_response(raw, content, file_type, log_f)
+        if complete:
+            _store_cached_extract(cache_dir, cache_key, result)
+        return result
         
     except Exception as e:
+        return _extract_failure(e, content, file_type, log_f)
+
+
+async def aget_extract(content, file_type=None, urls_metadata=None, log_f=None, is_linkedin=False, cache_dir=None):
+    """Async variant of get_extract, so many extracts can be awaited concurrently."""
+    if cache_dir is None:
+        cache_dir = EXTRACT_CACHE_DIR
+    try:
+        missing_key = _ensure_api_key(log_f)
+        if missing_key:
+            return missing_key
+        
+        # Everything below (prompt choice, cache key, parsing) only needs a bounded slice
+        content = _truncate_for_llm(content)
+        
+        model, extract_length, prompt = _build_extract_prompt(content, file_type, urls_metadata, is_linkedin)
+        
+        cache_key = _extract_cache_key(model, prompt, content)
+        cached = _load_cached_extract(cache_dir, cache_key)
+        if cached:
+            return cached
+        
         if log_f:
-            log_f.write(f"OpenAI ERROR: {e}\n")
-        print(f"🚫 Error in get_extract: {e}")
+            log_f.write(f"OpenAI Prompt: {prompt[:500]}...\n")
+        
+        response = await _acreate_chat_completion(
+            model=model,
+            messages=[
+                {"role": "system", "content": "You analyze content and extract semantic meaning."},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=extract_length,
+            temperature=0.7
+        )
+        raw = response["choices"][0]["message"]["content"]
+        
+        if log_f:
+            log_f.write(f"OpenAI Raw Response: {raw[:500]}...\n")
+        
+        result, complete = _parse_extract_response(raw, content, file_type, log_f)
+        if complete:
+            _store_cached_extract(cache_dir, cache_key, result)
+        return result
+    except Exception as e:
+        return _extract_failure(e, content, file_type, log_f)
+
+async def aget_extracts(jobs, concurrency=16):
+    """
+    Run aget_extract for many documents at once.
+    
+    Args:
+        jobs: Iterable of dicts of aget_extract keyword arguments (each needs "content").
+        concurrency: Maximum number of OpenAI requests in flight.
+    
+    Returns:
+        List of (title, extract, tags) tuples in the same order as jobs.
+    """
+    sem = asyncio.Semaphore(concurrency)
+    
+    async def run(job):
+        async with sem:
+            return await aget_extract(**job)
+    
+    return await asyncio.gather(*[run(job) for job in jobs])
+
+def _read_plain_text(path):
+    """Read a plain .txt file, ignoring undecodable bytes."""
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        return f.read()
+
+def _decode_fallback(path):
+    """
+    Decode a file of unknown type as UTF-8, falling back to latin-1. Returns (text, method).
+    
+    The decoded text becomes the metadata body and is indexed, so UTF-8 text is
+    kept whole. The UTF-8 check runs on the first FALLBACK_READ_BYTES, and files
+    that fail it stop there, so large binaries aren't pulled into memory.
+    """
+    with open(path, "rb") as f:
+        raw_bytes = f.read(FALLBACK_READ_BYTES)
+        at_eof = len(raw_bytes) < FALLBACK_READ_BYTES
+        try:
+            # Incremental decode so a multi-byte character cut off at the read boundary isn't an error
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            text = decoder.decode(raw_bytes, final=at_eof)
+            if not at_eof:
+                text += decoder.decode(f.read(), final=True)
+            return text, "decode_utf8"
+        except UnicodeDecodeError:
+            text = raw_bytes.decode("latin-1", errors="ignore")
+            if os.fstat(f.fileno()).st_size > len(raw_bytes):
+                text += FALLBACK_TRUNCATED_MARKER
+            return text, "decode_latin1"
+
+# file_type -> (extractor, extraction_method). Extension-specific entries take precedence.
+# A None method means the extractor returns (text, extraction_method) itself
+EXTRACTORS = {
+    "pdf": (_extract_pdf, None),
+    "image": (extract_text_from_image, "ocr"),
+    "document": (extract_text_from_docx, "docx"),
+    "presentation": (extract_text_from_pptx, "pptx"),
+    "spreadsheet": (extract_text_from_xlsx, "xlsx"),
+    "rtf": (extract_text_from_rtf, "rtf"),
+    "text": (_read_plain_text, "textread"),
+}
+_EXT_EXTRACTORS = {
+    ".md": (extract_text_from_markdown, "markdown"),
+}
+
+def _extract_any(input_path, file_type):
+    """
+    Extract text from a file with the extractor for its type. Runs in a worker process,
+    or on the calling thread for INLINE_EXTRACT_TYPES.
+    
+    Returns:
+        Tuple of (text_content, extraction_method, is_linkedin, extraction_failed).
+    """
+    file_name = os.path.basename(input_path)
+    is_linkedin = False
+
+    logger.info(f"Dispatching based on file_type: '{file_type}' for file: {file_name}") # DEBUG LOG
+    ext = os.path.splitext(input_path)[1].lower()
+    fn, extraction_method = _EXT_EXTRACTORS.get(ext) or EXTRACTORS.get(file_type, (None, None))
+    if fn and extraction_method is None:
+        text_content, extraction_method = fn(input_path)
+    elif fn:
+        text_content = fn(input_path)
+    else:
+        logger.warning(f"File type '{file_type}' for {file_name} not handled by specific extractors, falling back to decode.") # DEBUG LOG
+        text_content, extraction_method = _decode_fallback(input_path)
+    
+    if file_type == "pdf":
+        is_linkedin = bool(text_content) and _looks_like_linkedin(text_content)
+    
+    extraction_failed = isinstance(text_content, ExtractionFailure)
+    logger.info(f"File: {file_name}, Extraction method: {extraction_method}, Failed: {extraction_failed}") # DEBUG LOG
+    
+    return text_content, extraction_method, is_linkedin, extraction_failed
+
+class _AsyncOpenAIRunner:
+    """
+    Runs OpenAI requests for organize_files worker threads on one background event loop.
+    
+    A dedicated loop (rather than asyncio.run) keeps organize_files callable from
+    code that is already inside an event loop, such as the FastAPI endpoints.
+    """
+    
+    def __init__(self, concurrency):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="openai-loop", daemon=True)
+        self._thread.start()
+        self._sem = asyncio.run_coroutine_threadsafe(self._make_semaphore(concurrency), self._loop).result()
+    
+    @staticmethod
+    async def _make_semaphore(concurrency):
+        # Created on the loop itself so it binds to the right loop on every Python version
+        return asyncio.Semaphore(concurrency)
+    
+    async def _acreate(self, **kwargs):
+        async with self._sem:
+            return await _acreate_chat_completion(**kwargs)
+    
+    def chat_completion(self, **kwargs):
+        """Blocking ChatCompletion for worker threads; the request itself runs on the loop."""
+        return asyncio.run_coroutine_threadsafe(self._acreate(**kwargs), self._loop).result()
+    
+    def close(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+class _ExtractionPool:
+    """
+    Process pool for organize_files extraction that replaces itself if a worker dies.
+    
+    A worker killed mid-file (OOM on a huge PDF, a native parser crash) breaks a
+    ProcessPoolExecutor for good, so every later submit would fail. Here
+    the first thread to see the break starts a fresh pool, and each affected
+    file is retried once in a single-use process of its own, so the file that
+    crashed can't take the new pool down with it. If the retry dies too,
+    BrokenProcessPool propagates.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pool = self._new_pool()
+    
+    @staticmethod
+    def _new_pool(max_workers=None):
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers or os.cpu_count(), mp_context=_pool_context(), initializer=_mark_pool_worker
+        )
+    
+    def run(self, fn, *args):
+        """Run fn(*args) in a worker process and return its result."""
+        pool = self._pool
+        try:
+            return pool.submit(fn, *args).result()
+        except BrokenProcessPool:
+            with self._lock:
+                if self._pool is pool:  # Not yet replaced by another thread
+                    logger.warning("Extraction worker process died; starting a new pool")
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    self._pool = self._new_pool()
+        with self._new_pool(max_workers=1) as isolated:
+            return isolated.submit(fn, *args).result()
+    
+    def close(self):
+        self._pool.shutdown(wait=True)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+def _unique_output_path(output_folder, metadata_folder, file_name, file_type, reserved_paths):
+    """
+    Pick the organized and metadata locations for a file, avoiding existing and already-claimed names.
+    
+    Files that differ only by extension (rep.txt, rep.md) would share a metadata
+    file, so the metadata path is claimed along with the output path.
+    
+    Returns:
+        Tuple of (file_name, output_path, metadata_path).
+    """
+    # Define source_type_dir based on file_type or a default
+    source_type_dir = os.path.join(output_folder, file_type if file_type != "other" else "sources")
+    name, ext = os.path.splitext(file_name)
+
+    def taken(path):
+        return path in reserved_paths or os.path.exists(path)
+
+    # Workers pick names concurrently, so check-and-claim must happen under one lock.
+    # source_type_dir itself was created up front by organize_files
+    with _output_paths_lock:
+        output_path = os.path.join(source_type_dir, file_name)
+        metadata_path = _metadata_path_for(metadata_folder, file_name)
+
+        # If either name is taken, add a random suffix to make it unique
+        # (a timestamp collides when two same-named files arrive in the same second)
+        while taken(output_path) or taken(metadata_path):
+            suffix = uuid.uuid4().hex[:8]
+            file_name = f"{name}_{suffix}{ext}"
+            output_path = os.path.join(source_type_dir, file_name)
+            metadata_path = _metadata_path_for(metadata_folder, file_name)
+        
+        reserved_paths.add(output_path)
+        reserved_paths.add(metadata_path)
+    return file_name, output_path, metadata_path
+
+def _file_digest(path):
+    """Hash a file's bytes in 1 MB chunks (xxh3 when available, else blake2b)."""
+    h = _content_hasher()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class _ContentCache:
+    """
+    Maps (content hash, file type) to the metadata file produced for it.
+    
+    Lets organize_files skip extraction and the OpenAI call for a file whose
+    exact bytes were already organized, e.g. when re-running on a partially
+    processed inbox. Persisted as JSON next to the metadata.
+    """
+    
+    def __init__(self, metadata_folder):
+        self.path = os.path.join(metadata_folder, CONTENT_CACHE_NAME)
+        self._lock = threading.Lock()
+        self._dirty = False
+        try:
+            with open(self.path, "rb") as f:
+                self._entries = _json_loads(f.read())
+        except (OSError, ValueError):
+            self._entries = {}
+    
+    @staticmethod
+    def _key(digest, file_type):
+        return f"{file_type}:{digest}"
+    
+    def get(self, digest, file_type):
+        """
+        Return the cached metadata as a post ready to reuse for a new copy, or None.
         
-        # Provide a more meaningful extract with the error
-        error_title = "Extraction Failed"
-        error_extract = f"The AI extraction process encountered an error: {str(e)}\n\nContent preview:\n{content[:300]}..."
+        The metadata file must still carry this content hash and file type; a file
+        that was edited, replaced or unreadable counts as a miss.
+        """
+        key = self._key(digest, file_type)
+        with self._lock:
+            metadata_path = self._entries.get(key)
+        if not metadata_path:
+            return None
+        try:
+            post = frontmatter.load(metadata_path)
+        except Exception as e:
+            logger.warning(f"Ignoring content cache entry {metadata_path}: {e}")
+            post = None
+        if post is None or post.get("content_hash") != digest or post.get("file_type") != file_type:
+            with self._lock:
+                if self._entries.get(key) == metadata_path:
+                    del self._entries[key]
+                    self._dirty = True
+            return None
+        # A duplicate is a new file as far as review is concerned
+        post["reviewed"] = False
+        post["reprocess_status"] = "none"
+        post["reprocess_rounds"] = "0"
+        return post
+    
+    def put(self, digest, file_type, metadata_path):
+        with self._lock:
+            self._entries[self._key(digest, file_type)] = metadata_path
+            self._dirty = True
+    
+    def save(self):
+        """Write the index atomically if anything was added this run."""
+        if not self._dirty:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write content cache {self.path}: {e}")
+
+def _metadata_path_for(metadata_folder, file_name):
+    """Metadata file location for an organized file name."""
+    safe_stem = _SAFE_NAME_RE.sub('_', os.path.splitext(file_name)[0])
+    return os.path.join(metadata_folder, safe_stem + ".md")
+
+def iter_inbox(root):
+    """Lazily yield paths of non-hidden files under root, skipping hidden directories too."""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.name.startswith('.'):  # Skip hidden files and folders
+                    continue
+                # DirEntry caches the type from the directory read, so no extra stat
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file():
+                    yield entry.path
+
+def _dispatch_order(paths):
+    """Order a batch of inbox paths by type, heaviest extraction first (EXTRACT_DISPATCH_ORDER)."""
+    groups = collections.defaultdict(list)
+    for input_path in paths:
+        groups[_ext_to_type(os.path.splitext(input_path)[1])].append(input_path)
+    ordered_types = [t for t in EXTRACT_DISPATCH_ORDER if t in groups]
+    ordered_types += [t for t in groups if t not in EXTRACT_DISPATCH_ORDER]
+    return itertools.chain.from_iterable(groups[t] for t in ordered_types)
+
+def _process_one(input_path, output_folder, metadata_folder, openai_model, cpu_pool, reserved_paths, llm, writer, content_cache, today):
+    """
+    Extract, describe and file a single inbox file. Runs on a worker thread.
+    
+    Returns:
+        Dict with status ("success", "basic", "cached", "error", "deferred" or "skipped"),
+        metadata_path and error.
+    """
+    # Skip if the file no longer exists (it might have been moved by a parallel process)
+    if not os.path.exists(input_path):
+        return {"status": "skipped", "metadata_path": None, "error": None}
+    
+    try:
+        file_type = _ext_to_type(os.path.splitext(input_path)[1])
+        logger.info(f"Processing file: {os.path.basename(input_path)}, Inferred type: {file_type}") # DEBUG LOG
         
-        # Generate tags based on available information
-        fallback_tags = ["extraction_failed"]
-        if file_type:
-            fallback_tags.append(file_type.capitalize())
+        # Identical bytes already organized: reuse that metadata instead of extracting again
+        digest = _file_digest(input_path)
+        post = content_cache.get(digest, file_type)
+        if post is not None:
+            file_name, output_path, metadata_path = _unique_output_path(
+                output_folder, metadata_folder, os.path.basename(input_path), file_type, reserved_paths
+            )
+            post["source"] = file_name
+            _write_and_move(post, metadata_path, input_path, output_path, writer=writer)
+            print(f"Organized from cache: {file_name} -> {output_path}")
+            return {"status": "cached", "metadata_path": metadata_path, "error": None}
         
-        return error_title, error_extract, fallback_tags
+        # CPU-bound extraction goes to the process pool; this thread just waits for it.
+        # Light types are read right here
+        if file_type in INLINE_EXTRACT_TYPES:
+            text_content, extraction_method, is_linkedin, extraction_failed = _extract_any(input_path, file_type)
+        else:
+            text_content, extraction_method, is_linkedin, extraction_failed = cpu_pool.run(
+                _extract_any, input_path, file_type
+            )
+        file_name, output_path, metadata_path = _unique_output_path(
+            output_folder, metadata_folder, os.path.basename(input_path), file_type, reserved_paths
+        )
+        if extraction_failed:
+            # Don't ask the model to summarize an error message, and don't cache it:
+            # the next copy of these bytes gets a fresh extraction attempt
+            print(f"Extraction failed for {file_name}: {text_content[:200]}")
+            basic_metadata(input_path, output_path, metadata_path, file_name, file_type, text_content, extraction_method, today=today, writer=writer)
+            return {"status": "basic", "metadata_path": metadata_path, "error": None}
+        status = _organize_extracted(
+            input_path, output_path, metadata_path, file_name, file_type,
+            text_content, extraction_method, is_linkedin, openai_model, llm, writer, today, content_hash=digest
+        )
+        if status == "success":
+            # Fallback metadata isn't cached, so those files get another OpenAI attempt next run
+            content_cache.put(digest, file_type, metadata_path)
+        return {"status": status, "metadata_path": metadata_path, "error": None}
+    except BrokenProcessPool as e:
+        # The crash may not be this file's fault, and it was never looked at: leave it
+        # in the inbox for the next run instead of filing it under errors
+        logger.error(f"Extraction worker crashed while processing {input_path}; leaving it in the inbox: {e}")
+        return {"status": "deferred", "metadata_path": None, "error": f"Left in inbox, extraction worker crashed: {e}"}
+    except Exception as e:
+        logger.error(f"Error processing {input_path} in organize_files: {str(e)}", exc_info=True)
+        writer.put_error(input_path)
+        return {"status": "error", "metadata_path": None, "error": str(e)}
+
+def _organize_extracted(input_path, output_path, metadata_path, file_name, file_type, text_content, extraction_method, is_linkedin, openai_model, llm, writer, today, content_hash=None):
+    """
+    Generate metadata for an extracted file, write it and move the source.
+    
+    Returns:
+        parse_status: "success" for AI-generated metadata and "basic" for the fallback.
+    """
+    # Prepare metadata
+    content_preview = text_content[:2000] if text_content else ""
+    
+    # Generate response type
+    response_type = "extract"
+    if is_linkedin:
+        response_type = "linkedin_post"
+    
+    # Generate metadata using OpenAI
+    if text_content and len(text_content.strip()) > 0:
+        try:
+            completion = llm.chat_completion(
+                model=openai_model,
+                messages=[
+                    {"role": "system", "content": f"You are an AI that extracts metadata from documents. The response should be a JSON object with the following fields: title (a concise title for the document), author (the author of the document or 'Unknown'), date (the publication date in YYYY-MM-DD format or '{today}' if unknown), category (one of: Article, Book, Note, Report, Social Media, Website, Email, Other), tags (an array of 2-5 relevant keywords/topics), extract_title (a specific title or headline from the content), extract_content (a 2-3 paragraph extract of the most important or interesting content). The response should be a markdown frontmatter style data."},
+                    {"role": "user", "content": f"Extract metadata from this {response_type}. The file is called '{file_name}'.\n\nContent preview:\n{content_preview}"}
+                ]
+            )
+            
+            # Parse OpenAI response
+            # ADD ROBUST CHECKS HERE:
+            ai_response_content = None
+            if completion and hasattr(completion, 'choices') and isinstance(completion.choices, list) and len(completion.choices) > 0:
+                choice = completion.choices[0]
+                if choice and hasattr(choice, 'message') and choice.message and hasattr(choice.message, 'content'):
+                    ai_response_content = choice.message.content
+                else:
+                    logger.error(f"OpenAI response 'choice', 'message' or 'content' is invalid for {file_name}. Choice: {choice}, Message: {getattr(choice, 'message', 'N/A')}")
+            else:
+                logger.error(f"OpenAI response 'completion.choices' is not a non-empty list for {file_name}. Choices type: {type(getattr(completion, 'choices', None))}, Choices: {getattr(completion, 'choices', 'N/A')}")
+
+            if ai_response_content:
+                ai_response = ai_response_content.strip()
+                # ... (rest of your JSON parsing)
+                try:
+                    metadata_dict = json.loads(ai_response)
+                    _emit("success", metadata_dict, file_name=file_name, file_type=file_type,
+                          extraction_method=extraction_method, text_content=text_content,
+                          metadata_path=metadata_path, input_path=input_path, output_path=output_path,
+                          is_linkedin=is_linkedin, content_hash=content_hash, writer=writer)
+                    
+                    print(f"Organized: {file_name} -> {output_path}")
+                    return "success"
+                except json.JSONDecodeError:
+                    # Handle non-JSON response
+                    print(f"Non-JSON response for {file_name}")
+                    # Use basic metadata instead
+                    basic_metadata(input_path, output_path, metadata_path, file_name, file_type, text_content, extraction_method, today=today, writer=writer)
+            else:
+                # Handle case where ai_response_content is None (OpenAI call failed to produce usable content)
+                logger.error(f"No valid content from OpenAI for {file_name}.")
+                basic_metadata(input_path, output_path, metadata_path, file_name, file_type, text_content or "", extraction_method, today=today, writer=writer)
+                return "basic" # Nothing more to do for this file
+        except Exception as e:
+            print(f"Error generating metadata for {file_name}: {str(e)}")
+            # Use basic metadata instead
+            basic_metadata(input_path, output_path, metadata_path, file_name, file_type, text_content, extraction_method, today=today, writer=writer)
+    else:
+        # No content extracted, use basic metadata
+        print(f"No content extracted from {file_name}")
+        basic_metadata(input_path, output_path, metadata_path, file_name, file_type, text_content, extraction_method, today=today, writer=writer)
+    return "basic"
+
+def _emit(status, metadata_dict, *, file_name, file_type, extraction_method, text_content,
+          metadata_path, input_path, output_path, is_linkedin=False, content_hash=None, same_fs=False, writer=None):
+    """
+    Complete a metadata dict with the bookkeeping fields, then write it and move the source.
+    
+    Shared by the AI-generated ("success") and fallback ("basic") paths so both
+    produce the same schema. metadata_dict is updated in place.
+    """
+    metadata_dict.update({
+        "parse_status": status,
+        "extraction_method": extraction_method,
+        "file_type": file_type,
+        "source": file_name,
+        "reviewed": False,
+        "reprocess_status": "none",
+        "reprocess_rounds": "0",
+        "source_url": None,
+    })
+    if content_hash:
+        # Lets the content cache confirm this file still describes those bytes
+        metadata_dict["content_hash"] = content_hash
+    
+    # Ensure tags is a list
+    tags = metadata_dict.get("tags")
+    if not tags:
+        tags = []
+    elif isinstance(tags, str):
+        # Convert comma-separated string to list
+        tags = [tag.strip() for tag in tags.split(",")]
+    # Special handling for LinkedIn posts
+    if is_linkedin and "linkedin" not in tags:
+        tags.append("linkedin")
+    metadata_dict["tags"] = tags
+    
+    # Serialize once; the post is the only other reference to the full text
+    post = frontmatter.Post(text_content if text_content is not None else "", **metadata_dict)
+    _write_and_move(post, metadata_path, input_path, output_path, same_fs, writer)
+
+def _yaml_str(value):
+    """Render a string as a YAML double-quoted scalar (JSON string syntax is valid YAML)."""
+    text = json.dumps(value, ensure_ascii=False)
+    return _YAML_UNPRINTABLE_RE.sub(lambda m: f"\\u{ord(m.group()):04x}", text)
+
+def _render_frontmatter(metadata, content):
+    """
+    Render a metadata file without PyYAML for the fixed organize_files schema.
+    
+    Output has the same layout as frontmatter.dump (sorted keys, block-style
+    lists). Returns None when a field or value falls outside the schema, or
+    any text holds a lone surrogate, so the caller can use the frontmatter
+    library instead (which raises for those, sending the file to basic metadata).
+    """
+    if _SURROGATE_RE.search(content):
+        return None
+    lines = []
+    for key in sorted(metadata):
+        if key not in _FRONTMATTER_FIELDS:
+            return None
+        value = metadata[key]
+        if value is None:
+            lines.append(f"{key}: null")
+        elif isinstance(value, bool):
+            lines.append(f"{key}: {'true' if value else 'false'}")
+        elif isinstance(value, str):
+            if _SURROGATE_RE.search(value):
+                return None
+            lines.append(f"{key}: {_yaml_str(value)}")
+        elif isinstance(value, list) and all(isinstance(item, str) and not _SURROGATE_RE.search(item) for item in value):
+            if not value:
+                lines.append(f"{key}: []")
+            else:
+                lines.append(f"{key}:")
+                lines.extend(f"- {_yaml_str(item)}" for item in value)
+        else:
+            return None
+    header = "\n".join(lines)
+    return f"---\n{header}\n---\n\n{content}".rstrip().encode("utf-8")
+
+def _write_and_move(post, metadata_path, input_path, output_path, same_fs=False, writer=None):
+    """Serialize a metadata post and file the source, via the background writer if given."""
+    data = _render_frontmatter(post.metadata, post.content)
+    if data is None:
+        # Custom fields or value types from the model: let PyYAML handle them
+        buf = io.BytesIO()
+        frontmatter.dump(post, buf)
+        data = buf.getvalue()
+    if writer is not None:
+        writer.put(metadata_path, data, input_path, output_path)
+        return
+    _write_bytes_atomic(metadata_path, data)
+    _fast_move(input_path, output_path, same_fs)
+
+def _write_bytes_atomic(path, data):
+    """Write a file via a temp file and rename, so concurrent writers never interleave bytes."""
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        Path(tmp_path).write_bytes(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+class _MetadataWriter:
+    """
+    Background threads that write metadata files and move sources for organize_files.
+    
+    Workers hand over pre-serialized bytes through a bounded queue, so they go
+    back to extraction and OpenAI calls instead of waiting on disk I/O. Every
+    move into output_folder (one device) goes through this small pool, and the
+    bounded queue back-pressures workers when the disk falls behind.
+    """
+    
+    def __init__(self, output_folder, same_fs=False, maxsize=128, workers=MOVE_WORKERS):
+        self.output_folder = output_folder
+        self.same_fs = same_fs
+        self.errors = []  # (file_name, error) for writes that failed
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._threads = [
+            threading.Thread(target=self._run, name=f"move-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+    
+    def put(self, metadata_path, data, input_path, output_path):
+        self._queue.put((metadata_path, data, input_path, output_path))
+    
+    def put_error(self, input_path):
+        """Queue a failed file for the errors folder."""
+        self._queue.put((None, None, input_path, None))
+    
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            metadata_path, data, input_path, output_path = item
+            if metadata_path is None:
+                try:
+                    _move_to_errors(input_path, self.output_folder, self.same_fs)
+                except Exception as move_error:
+                    logger.error(f"Could not move {input_path} to errors: {move_error}")
+                continue
+            try:
+                _write_bytes_atomic(metadata_path, data)
+                _fast_move(input_path, output_path, self.same_fs)
+            except Exception as e:
+                logger.error(f"Error writing metadata for {input_path}: {str(e)}", exc_info=True)
+                self.errors.append((os.path.basename(input_path), str(e)))
+                try:
+                    _move_to_errors(input_path, self.output_folder, self.same_fs)
+                except Exception as move_error:
+                    logger.error(f"Could not move {input_path} to errors: {move_error}")
+    
+    def close(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+def _fast_move(src, dst, same_fs=False):
+    """Move a file with a single rename when both paths are on one filesystem."""
+    if same_fs:
+        try:
+            os.replace(src, dst)
+            return
+        except OSError as e:
+            if e.errno != errno.EXDEV:  # e.g. an inbox subfolder that is a separate mount
+                raise
+    shutil.move(src, dst)
+
+def _move_to_errors(input_path, output_folder, same_fs=False):
+    """Move a file that failed processing into the errors folder."""
+    if not os.path.exists(input_path):
+        return
+    error_folder = os.path.join(output_folder, "errors")  # Created up front by organize_files
+    error_path = os.path.join(error_folder, os.path.basename(input_path))
+    try:
+        _fast_move(input_path, error_path, same_fs)
+    except:
+        # If moving fails, just delete it
+        os.remove(input_path)
 
 def organize_files(input_folder="inbox", output_folder="assets", metadata_folder="metadata", api_key=None, openai_model="gpt-3.5-turbo", debug=False):
     """
@@ -651,229 +1841,93 @@ def organize_files(input_folder="inbox", output_folder="assets", metadata_folder
     os.makedirs(input_folder, exist_ok=True)
     os.makedirs(output_folder, exist_ok=True)
     os.makedirs(metadata_folder, exist_ok=True)
-    os.makedirs(os.path.join(output_folder, "sources"), exist_ok=True)
+    # Create every destination folder once instead of per file
+    for folder in OUTPUT_SUBFOLDERS:
+        os.makedirs(os.path.join(output_folder, folder), exist_ok=True)
     
-    # Get list of files in inbox
-    inbox_files = []
-    for root, _, files in os.walk(input_folder):
-        for file in files:
-            if file.startswith('.'):  # Skip hidden files
-                continue
-            inbox_files.append(os.path.join(root, file))
+    # Same-device moves can be a plain rename; check once rather than per file
+    same_fs = os.stat(input_folder).st_dev == os.stat(output_folder).st_dev
     
-    print(f"Found {len(inbox_files)} files in inbox")
-    if len(inbox_files) == 0:
-        return
+    # One date stamp for the whole run
+    today = time.strftime("%Y-%m-%d")
     
-    # Process each file
-    for file_index, input_path in enumerate(inbox_files):
-        if debug:
-            print(f"Processing {file_index+1}/{len(inbox_files)}: {input_path}")
+    # Each file is handled end to end on its own thread, which mostly waits on I/O
+    # (OpenAI, moves, metadata writes). CPU-bound extraction (OCR, PDF, Office) is
+    # handed to a process pool so it doesn't contend for the GIL.
+    reserved_paths = set()
+    metadata_written = 0
+    errors = []
+    max_workers = min(32, (os.cpu_count() or 1) + 4)
+    # OpenAI calls from every worker are multiplexed on one event loop, bounded by a semaphore
+    llm = _AsyncOpenAIRunner(LLM_CONCURRENCY)
+    # Metadata writes and moves drain through a few background threads
+    writer = _MetadataWriter(output_folder, same_fs)
+    content_cache = _ContentCache(metadata_folder)
+    with llm, writer, _ExtractionPool() as cpu_pool, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as ex:
+        # The walk is consumed in bounded batches, each grouped by type so same-library
+        # work is dispatched together, and work starts before the walk ends. Results are
+        # tallied as they finish and a new batch waits until no more than one batch is
+        # still in flight, so neither the paths nor their futures pile up.
+        pending = {}
+        processed_count = 0
         
-        # Skip if the file no longer exists (it might have been moved by a parallel process)
-        if not os.path.exists(input_path):
-            continue
+        def tally(done):
+            nonlocal metadata_written
+            for future in done:
+                input_path = pending.pop(future)
+                result = future.result()
+                if result["status"] in ("success", "basic", "cached"):
+                    metadata_written += 1
+                elif result["status"] in ("error", "deferred"):
+                    errors.append((os.path.basename(input_path), result["error"]))
         
-        # Skip hidden files
-        if os.path.basename(input_path).startswith('.'):
-            continue
+        inbox = iter_inbox(input_folder)
+        while True:
+            batch = list(itertools.islice(inbox, INBOX_BATCH_SIZE))
+            if not batch:
+                break
+            for input_path in _dispatch_order(batch):
+                processed_count += 1
+                if debug:
+                    print(f"Processing {processed_count}: {input_path}")
+                pending[ex.submit(
+                    _process_one, input_path, output_folder, metadata_folder, openai_model, cpu_pool, reserved_paths, llm, writer, content_cache, today
+                )] = input_path
+            while len(pending) > INBOX_BATCH_SIZE:
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                tally(done)
         
-        try:
-            file_name = os.path.basename(input_path)
-            file_type = infer_file_type(file_name)
-            logger.info(f"Processing file: {file_name}, Inferred type: {file_type}") # DEBUG LOG
-
-            # Define source_type_dir based on file_type or a default
-            # This was missing and causing an error.
-            # Assuming output_folder is the base for source types.
-            source_type_dir = os.path.join(output_folder, file_type if file_type != "other" else "sources")
-            os.makedirs(source_type_dir, exist_ok=True) # Ensure the directory exists
-
-            output_path = os.path.join(source_type_dir, file_name) # Now output_path is defined correctly before potential modification
-
-            # If a file with the same name exists, add a timestamp to make it unique
-            if os.path.exists(output_path):
-                name, ext = os.path.splitext(file_name)
-                timestamp = int(time.time())
-                file_name = f"{name}_{timestamp}{ext}"
-                output_path = os.path.join(source_type_dir, file_name)
-            
-            # Extract text content based on file type
-            text_content = None
-            extraction_method = "unknown"
-            is_linkedin = False
-
-            logger.info(f"Dispatching based on file_type: '{file_type}' for file: {file_name}") # DEBUG LOG
-            if file_type == "pdf":
-                text_content = extract_text_from_pdf(input_path)
-                extraction_method = "pdfplumber"
-                if text_content: # Check if text_content is not None or empty
-                    is_linkedin = "linkedin.com" in text_content.lower() or "Profile viewers" in text_content[:500]
-            elif file_type == "image":
-                text_content = extract_text_from_image(input_path)
-                extraction_method = "ocr"
-            elif file_type == "document": # This should be hit for .docx
-                text_content = extract_text_from_docx(input_path)
-                extraction_method = "docx"
-                logger.info(f"Used extract_text_from_docx. Resulting text_content (first 50 chars): {str(text_content)[:50]}") # DEBUG LOG
-            elif file_type == "presentation":
-                text_content = extract_text_from_pptx(input_path)
-                extraction_method = "pptx"
-            elif file_type == "spreadsheet":
-                text_content = extract_text_from_xlsx(input_path)
-                extraction_method = "xlsx"
-            elif file_type == "rtf":
-                text_content = extract_text_from_rtf(input_path)
-                extraction_method = "rtf"
-            elif file_type == "text" and input_path.lower().endswith((".md", ".txt")): # Ensure .txt also uses this if desired, or separate
-                # For .md, you might want extract_text_from_markdown if it does more than just read
-                # For .txt, reading directly is fine
-                if input_path.lower().endswith(".md"):
-                    text_content = extract_text_from_markdown(input_path) # Assuming this exists and is preferred for .md
-                    extraction_method = "markdown"
-                else: # Handle .txt
-                    with open(input_path, "r", encoding="utf-8", errors="ignore") as f:
-                        text_content = f.read()
-                    extraction_method = "textread"
-            else:
-                logger.warning(f"File type '{file_type}' for {file_name} not handled by specific extractors, falling back to decode.") # DEBUG LOG
-                with open(input_path, "rb") as f:
-                    raw_bytes = f.read()
-                try:
-                    text_content = raw_bytes.decode("utf-8")
-                    extraction_method = "decode_utf8"
-                except UnicodeDecodeError:
-                    text_content = raw_bytes.decode("latin-1", errors="ignore")
-                    extraction_method = "decode_latin1"
-            
-            logger.info(f"File: {file_name}, Extraction method: {extraction_method}") # DEBUG LOG
-
-            # Prepare metadata
-            content_preview = text_content[:2000] if text_content else ""
-            
-            # Generate safe filename for metadata
-            metadata_filename = re.sub(r'[^\w\-_\. ]', '_', file_name)
-            metadata_path = os.path.join(metadata_folder, f"{os.path.splitext(metadata_filename)[0]}.md")
-            
-            # Generate response type
-            response_type = "extract"
-            if is_linkedin:
-                response_type = "linkedin_post"
-            
-            # Generate metadata using OpenAI
-            today = time.strftime("%Y-%m-%d")
-            if text_content and len(text_content.strip()) > 0:
-                try:
-                    completion = openai.ChatCompletion.create(
-                        model=openai_model,
-                        messages=[
-                            {"role": "system", "content": f"You are an AI that extracts metadata from documents. The response should be a JSON object with the following fields: title (a concise title for the document), author (the author of the document or 'Unknown'), date (the publication date in YYYY-MM-DD format or '{today}' if unknown), category (one of: Article, Book, Note, Report, Social Media, Website, Email, Other), tags (an array of 2-5 relevant keywords/topics), extract_title (a specific title or headline from the content), extract_content (a 2-3 paragraph extract of the most important or interesting content). The response should be a markdown frontmatter style data."},
-                            {"role": "user", "content": f"Extract metadata from this {response_type}. The file is called '{file_name}'.\n\nContent preview:\n{content_preview}"}
-                        ]
-                    )
-                    
-                    # Parse OpenAI response
-                    # ADD ROBUST CHECKS HERE:
-                    ai_response_content = None
-                    if completion and hasattr(completion, 'choices') and isinstance(completion.choices, list) and len(completion.choices) > 0:
-                        choice = completion.choices[0]
-                        if choice and hasattr(choice, 'message') and choice.message and hasattr(choice.message, 'content'):
-                            ai_response_content = choice.message.content
-                        else:
-                            logger.error(f"OpenAI response 'choice', 'message' or 'content' is invalid for {file_name}. Choice: {choice}, Message: {getattr(choice, 'message', 'N/A')}")
-                    else:
-                        logger.error(f"OpenAI response 'completion.choices' is not a non-empty list for {file_name}. Choices type: {type(getattr(completion, 'choices', None))}, Choices: {getattr(completion, 'choices', 'N/A')}")
-
-                    if ai_response_content:
-                        ai_response = ai_response_content.strip()
-                        # ... (rest of your JSON parsing)
-                        try:
-                            metadata_dict = json.loads(ai_response)
-                            # Add additional metadata fields
-                            metadata_dict["parse_status"] = "success"
-                            metadata_dict["extraction_method"] = extraction_method
-                            metadata_dict["file_type"] = file_type
-                            metadata_dict["source"] = file_name
-                            metadata_dict["reviewed"] = False
-                            metadata_dict["reprocess_status"] = "none"
-                            metadata_dict["reprocess_rounds"] = "0"
-                            metadata_dict["source_url"] = None
-                            
-                            # Ensure tags is a list
-                            if not metadata_dict.get("tags"):
-                                metadata_dict["tags"] = []
-                            elif isinstance(metadata_dict.get("tags"), str):
-                                # Convert comma-separated string to list
-                                metadata_dict["tags"] = [tag.strip() for tag in metadata_dict["tags"].split(",")]
-                                
-                            # Special handling for LinkedIn posts
-                            if is_linkedin:
-                                if "tags" not in metadata_dict:
-                                    metadata_dict["tags"] = []
-                                if "linkedin" not in metadata_dict["tags"]:
-                                    metadata_dict["tags"].append("linkedin")
-                                
-                            # Create post with frontmatter
-                            current_text_content = text_content if text_content is not None else ""
-                            post = frontmatter.Post(current_text_content, **metadata_dict)
-                            
-                            with open(metadata_path, 'wb') as f:
-                                frontmatter.dump(post, f)
-                                
-                            # Move source file to organized location
-                            shutil.move(input_path, output_path)
-                            
-                            print(f"Organized: {file_name} -> {output_path}")
-                        except json.JSONDecodeError:
-                            # Handle non-JSON response
-                            print(f"Non-JSON response for {file_name}")
-                            # Use basic metadata instead
-                            basic_metadata(input_path, output_path, metadata_path, file_name, file_type, text_content, extraction_method)
-                    else:
-                        # Handle case where ai_response_content is None (OpenAI call failed to produce usable content)
-                        logger.error(f"No valid content from OpenAI for {file_name}.")
-                        basic_metadata(input_path, output_path, metadata_path, file_name, file_type, text_content or "", extraction_method)
-                        continue # Skip to next file
-                except Exception as e:
-                    print(f"Error generating metadata for {file_name}: {str(e)}")
-                    # Use basic metadata instead
-                    basic_metadata(input_path, output_path, metadata_path, file_name, file_type, text_content, extraction_method)
-            else:
-                # No content extracted, use basic metadata
-                print(f"No content extracted from {file_name}")
-                basic_metadata(input_path, output_path, metadata_path, file_name, file_type, text_content, extraction_method)
-                
-        except Exception as e:
-            logger.error(f"Error processing {input_path} in organize_files: {str(e)}", exc_info=True) # Add exc_info for traceback            # Move to error folder
-            error_folder = os.path.join(output_folder, "errors")
-            os.makedirs(error_folder, exist_ok=True)
-            error_path = os.path.join(error_folder, os.path.basename(input_path))
-            try:
-                shutil.move(input_path, error_path)
-            except:
-                # If moving fails, just delete it
-                os.remove(input_path)
+        print(f"Found {processed_count} files in inbox")
+        
+        tally(list(concurrent.futures.as_completed(pending)))
     
-    print("File organization complete")
+    content_cache.save()
+    
+    # Writes that failed after their worker had already reported success
+    metadata_written -= len(writer.errors)
+    errors.extend(writer.errors)
     
-    # Log out the final status for debugging
-    processed_count = len(inbox_files)
-    errors_count = len([f for f in os.listdir(output_folder) if f.endswith(".error")]) if os.path.exists(output_folder) else 0
-    metadata_count = len([f for f in os.listdir(metadata_folder) if f.endswith(".md")]) if os.path.exists(metadata_folder) else 0
+    if not processed_count:
+        return
     
+    print("File organization complete")
+    
+    # Log out the final status for debugging; the counters above replace re-listing the output folders
     logger.info(f"Organize files summary - Input folder: {input_folder}, Files processed: {processed_count}, "
-                f"Metadata files created: {metadata_count}, Errors: {errors_count}")
+                f"Metadata files written: {metadata_written}, Errors: {len(errors)}")
     
-    # Return success and failure metrics
+    # Return success and failure metrics for this run
     return {
-        "success_count": metadata_count,
+        "success_count": metadata_written,
         "processed_count": processed_count,
-        "failed_files": [(os.path.basename(f), "Processing failed") for f in os.listdir(output_folder) if f.endswith(".error")] if os.path.exists(output_folder) else []
+        "failed_files": errors
     }
     
-def basic_metadata(input_path, output_path, metadata_path, file_name, file_type, text_content, extraction_method):
+def basic_metadata(input_path, output_path, metadata_path, file_name, file_type, text_content, extraction_method, same_fs=False, today=None, writer=None):
     """Creates basic metadata when OpenAI processing fails"""
-    today = time.strftime("%Y-%m-%d")
+    if today is None:
+        today = time.strftime("%Y-%m-%d")
     
     # Ensure text_content is a string for safe operations
     current_text_content = text_content if text_content is not None else ""
@@ -887,22 +1941,8 @@ def basic_metadata(input_path, output_path, metadata_path, file_name, file_type,
         "tags": ["unprocessed"],
         # Use current_text_content which is guaranteed to be a string
         "extract_content": current_text_content[:500] + "..." if len(current_text_content) > 500 else current_text_content,
-        "parse_status": "basic",
-        "extraction_method": extraction_method,
-        "file_type": file_type,
-        "source": file_name,
-        "reviewed": False,
-        "reprocess_status": "none",
-        "reprocess_rounds": "0",
-        "source_url": None
     }
-    
-    # Create frontmatter post
-    post = frontmatter.Post(current_text_content, **metadata_dict) # Use current_text_content
-    
-    # Save metadata file
-    with open(metadata_path, 'wb') as f:
-        frontmatter.dump(post, f)
-        
-    # Move source file to organized location
-    shutil.move(input_path, output_path)
\ No newline at end of file
+    _emit("basic", metadata_dict, file_name=file_name, file_type=file_type,
+          extraction_method=extraction_method, text_content=current_text_content,
+          metadata_path=metadata_path, input_path=input_path, output_path=output_path,
+          same_fs=same_fs, writer=writer)